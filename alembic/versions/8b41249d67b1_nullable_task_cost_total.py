@@ -0,0 +1,45 @@
+"""nullable task cost total
+
+Revision ID: 8b41249d67b1
+Revises: e3c654422931
+Create Date: 2026-10-18 03:46:36.561877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41249d67b1'
+down_revision: Union[str, None] = 'e3c654422931'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('taskcostsummary') as batch_op:
+        batch_op.alter_column('total_cost',
+                              existing_type=sa.BIGINT(),
+                              nullable=True)
+    # Раньше задача, у всех строк которой quantity NULL, получала 0,
+    # а sum() по её строкам даёт NULL. Пересчитываем такие итоги.
+    op.execute(
+        'UPDATE taskcostsummary SET total_cost = ('
+        'SELECT sum(product.price * productquantity.quantity) '
+        'FROM productquantity JOIN product '
+        'ON product.id = productquantity.product_id '
+        'WHERE productquantity.task_id = taskcostsummary.task_id) '
+        'WHERE total_cost = 0'
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        'UPDATE taskcostsummary SET total_cost = 0 WHERE total_cost IS NULL'
+    )
+    with op.batch_alter_table('taskcostsummary') as batch_op:
+        batch_op.alter_column('total_cost',
+                              existing_type=sa.BIGINT(),
+                              nullable=False)
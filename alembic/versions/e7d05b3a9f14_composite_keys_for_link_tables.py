@@ -0,0 +1,61 @@
+"""composite keys for link tables
+
+Revision ID: e7d05b3a9f14
+Revises: c41f9a6d2e83
+Create Date: 2026-10-18 12:25:37.104566
+
+"""
+from typing import Sequence, Union
+from uuid import uuid4
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7d05b3a9f14'
+down_revision: Union[str, None] = 'c41f9a6d2e83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LINKS = (('usertask', 'user_id'), ('devicetask', 'device_id'))
+
+
+def upgrade() -> None:
+    for table, column in LINKS:
+        op.execute(
+            f'DELETE FROM {table} WHERE id NOT IN ('
+            f'SELECT min(id) FROM {table} GROUP BY {column}, task_id)'
+        )
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            batch_op.drop_index(f'ix_{table}_{column}_task_id')
+            batch_op.drop_column('id')
+            batch_op.create_primary_key(f'pk_{table}', [column, 'task_id'])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    for table, column in LINKS:
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            batch_op.add_column(sa.Column('id', sa.Uuid(), nullable=True))
+        links = sa.table(
+            table,
+            sa.column('id', sa.Uuid()),
+            sa.column(column, sa.Uuid()),
+            sa.column('task_id', sa.Uuid()),
+        )
+        for key, task_id in bind.execute(
+                sa.select(links.c[column], links.c.task_id)).all():
+            bind.execute(
+                links.update()
+                .where(links.c[column] == key, links.c.task_id == task_id)
+                .values(id=uuid4())
+            )
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            batch_op.drop_constraint(f'pk_{table}', type_='primary')
+            batch_op.alter_column('id', nullable=False)
+            batch_op.create_primary_key(f'pk_{table}', ['id'])
+            batch_op.create_index(
+                f'ix_{table}_{column}_task_id', [column, 'task_id'],
+                unique=True,
+            )
@@ -0,0 +1,211 @@
+"""Колоночная аналитика стоимости задач в памяти на NumPy.
+
+Таблицы productquantity, product, task и связи загружаются один раз,
+UUID заменяются плотными целыми кодами, а группировки считаются
+векторно. Итоги совпадают с SQL select_count_product_id_avg_price_sum_price.
+"""
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from quest import DeviceTask, Product, ProductQuantity, Task, UserTask
+
+# До 2**53 целые суммы во float64 точны, выше считаем в int64.
+_EXACT_FLOAT = 2 ** 53
+
+
+class GroupTotals(NamedTuple):
+    keys: np.ndarray
+    # None у групп, где все quantity NULL, как sum() в SQL; тогда
+    # массив с dtype=object.
+    total_cost: np.ndarray
+    avg_price: np.ndarray
+    line_items: np.ndarray
+
+    def rows(self):
+        return zip(self.keys.tolist(), self.avg_price.tolist(),
+                   self.total_cost.tolist())
+
+
+def _codes(ids: list) -> dict:
+    return {id_: code for code, id_ in enumerate(ids)}
+
+
+def _group_sum(keys: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    result = np.bincount(keys, weights=values, minlength=size)
+    if len(result) and np.abs(result).max() >= _EXACT_FLOAT:
+        result = np.zeros(size, dtype=np.int64)
+        np.add.at(result, keys, values.astype(np.int64))
+        return result
+    return result.astype(np.int64)
+
+
+class TaskCostFrame:
+    """Колонки строк заказа с кодами задач и продуктов."""
+
+    def __init__(
+            self,
+            task_ids: np.ndarray,
+            task_dates: np.ndarray,
+            product_ids: np.ndarray,
+            prices: np.ndarray,
+            line_task: np.ndarray,
+            line_product: np.ndarray,
+            quantity: np.ndarray,
+            has_quantity: np.ndarray,
+            device_links: tuple[np.ndarray, np.ndarray, np.ndarray],
+            user_links: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ):
+        self.task_ids = task_ids
+        self.task_dates = task_dates
+        self.product_ids = product_ids
+        self.prices = prices
+        self.line_task = line_task
+        self.line_product = line_product
+        self.quantity = quantity
+        self.has_quantity = has_quantity
+        self.device_links = device_links
+        self.user_links = user_links
+
+    @classmethod
+    def load(cls, session: Session, batch_size: int = 100000):
+        def rows(statement):
+            return session.execute(
+                statement.execution_options(yield_per=batch_size)
+            ).tuples()
+
+        tasks = session.execute(select(Task.id, Task.date)).all()
+        task_codes = _codes([id_ for id_, _ in tasks])
+        products = session.execute(select(Product.id, Product.price)).all()
+        product_codes = _codes([id_ for id_, _ in products])
+
+        line_task = []
+        line_product = []
+        quantity = []
+        for task_id, product_id, count in rows(select(
+                ProductQuantity.task_id,
+                ProductQuantity.product_id,
+                ProductQuantity.quantity,
+        )):
+            line_task.append(task_codes[task_id])
+            line_product.append(product_codes[product_id])
+            # NULL в quantity не даёт вклада в сумму, как в SQL sum(),
+            # а has_quantity отличает его от нуля.
+            quantity.append(count)
+
+        def links(model, column):
+            owners = []
+            owner_tasks = []
+            for owner_id, task_id in rows(select(column, model.task_id)):
+                owners.append(owner_id)
+                owner_tasks.append(task_codes[task_id])
+            owner_ids = np.array(sorted(set(owners)), dtype=object)
+            owner_codes = _codes(owner_ids.tolist())
+            return (
+                owner_ids,
+                np.array([owner_codes[id_] for id_ in owners],
+                         dtype=np.int64),
+                np.array(owner_tasks, dtype=np.int64),
+            )
+
+        return cls(
+            task_ids=np.array([id_ for id_, _ in tasks], dtype=object),
+            task_dates=np.array([date for _, date in tasks],
+                                dtype='datetime64[us]'),
+            product_ids=np.array([id_ for id_, _ in products], dtype=object),
+            prices=np.array([price for _, price in products], dtype=np.int64),
+            line_task=np.array(line_task, dtype=np.int64),
+            line_product=np.array(line_product, dtype=np.int64),
+            quantity=np.array([count or 0 for count in quantity],
+                              dtype=np.int64),
+            has_quantity=np.array([count is not None for count in quantity],
+                                  dtype=bool),
+            device_links=links(DeviceTask, DeviceTask.device_id),
+            user_links=links(UserTask, UserTask.user_id),
+        )
+
+    def line_prices(self, prices: np.ndarray | None = None) -> np.ndarray:
+        prices = self.prices if prices is None else prices
+        return prices[self.line_product]
+
+    def line_dates(self) -> np.ndarray:
+        return self.task_dates[self.line_task]
+
+    def _per_task(
+            self,
+            mask: np.ndarray | None,
+            prices: np.ndarray | None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Суммы по задачам: стоимость, цены, строки заказа
+        и строки с quantity не NULL."""
+        line_price = self.line_prices(prices)
+        line_task = self.line_task
+        quantity = self.quantity
+        has_quantity = self.has_quantity
+        if mask is not None:
+            line_price = line_price[mask]
+            line_task = line_task[mask]
+            quantity = quantity[mask]
+            has_quantity = has_quantity[mask]
+        size = len(self.task_ids)
+        return (
+            _group_sum(line_task, line_price * quantity, size),
+            _group_sum(line_task, line_price, size),
+            np.bincount(line_task, minlength=size),
+            np.bincount(line_task[has_quantity], minlength=size),
+        )
+
+    @staticmethod
+    def _totals(keys, total, price_sum, count, quantities) -> GroupTotals:
+        present = count > 0
+        total = total[present]
+        missing = quantities[present] == 0
+        if missing.any():
+            total = total.astype(object)
+            total[missing] = None
+        return GroupTotals(
+            keys=keys[present],
+            total_cost=total,
+            avg_price=price_sum[present] / count[present],
+            line_items=count[present],
+        )
+
+    def by_task(
+            self,
+            mask: np.ndarray | None = None,
+            prices: np.ndarray | None = None,
+    ) -> GroupTotals:
+        """Итоги по задачам.
+
+        :argument mask булев фильтр строк заказа
+        :argument prices цены продуктов для what-if расчёта,
+            в порядке product_ids"""
+        return self._totals(self.task_ids, *self._per_task(mask, prices))
+
+    def _by_links(self, links, mask, prices) -> GroupTotals:
+        owner_ids, owners, tasks = links
+        per_task = self._per_task(mask, prices)
+        size = len(owner_ids)
+        return self._totals(owner_ids, *(
+            _group_sum(owners, column[tasks], size) for column in per_task
+        ))
+
+    def by_device(self, mask=None, prices=None) -> GroupTotals:
+        return self._by_links(self.device_links, mask, prices)
+
+    def by_user(self, mask=None, prices=None) -> GroupTotals:
+        return self._by_links(self.user_links, mask, prices)
+
+    def by_date(self, unit: str = 'D', mask=None, prices=None) -> GroupTotals:
+        """Итоги по периодам Task.date, unit в единицах numpy: D, W, M, Y."""
+        buckets, codes = np.unique(
+            self.task_dates.astype(f'datetime64[{unit}]'),
+            return_inverse=True,
+        )
+        per_task = self._per_task(mask, prices)
+        size = len(buckets)
+        return self._totals(buckets, *(
+            _group_sum(codes, column, size) for column in per_task
+        ))
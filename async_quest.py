@@ -0,0 +1,82 @@
+"""Асинхронные варианты запросов и генерации из quest для async веб-слоя."""
+from collections.abc import AsyncIterator, Callable
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, \
+    async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+import quest
+from quest import Base, User
+
+ASYNC_DB_URL = 'sqlite+aiosqlite:///db.sqlite3'
+
+
+def create_async_db_engine(
+        url: str = ASYNC_DB_URL,
+        profile: str = 'oltp',
+        echo: bool = False,
+        **kwargs,
+) -> AsyncEngine:
+    """create_async_engine с PRAGMA профиля из quest.ENGINE_PROFILES."""
+    engine = create_async_engine(url, echo=echo, **kwargs)
+    quest.apply_engine_profile(engine.sync_engine, profile)
+    return engine
+
+
+def create_async_session_factory(
+        engine: AsyncEngine,
+) -> async_sessionmaker[AsyncSession]:
+    # Без expire_on_commit атрибуты после коммита не требуют
+    # неявной подгрузки, которая в async режиме недоступна.
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def iter_users_tasks(
+        session: AsyncSession,
+        batch_size: int = 1000,
+) -> AsyncIterator[tuple[str, int, list[UUID]]]:
+    """Асинхронный вариант quest.iter_users_tasks."""
+    request = await session.stream(
+        select(User)
+        .options(selectinload(User.tasks))
+        .execution_options(yield_per=batch_size)
+    )
+    async for user in request.scalars():
+        yield user.name, user.password, [task.id for task in user.tasks]
+
+
+async def do_select(session: AsyncSession):
+    async for row in iter_users_tasks(session):
+        print(*row)
+
+
+async def select_count_product_id_avg_price_sum_price(session: AsyncSession):
+    response = await session.execute(quest.task_cost_select())
+
+    for row in response:
+        print(row)
+
+
+async def data_generator(
+        model: Base,
+        fileds: dict[str, Callable],
+        count: int,
+        session: AsyncSession,
+        bulk: bool = False,
+        batch_size: int = 1000,
+) -> float:
+    """Асинхронный вариант quest.data_generator.
+
+    Генерация идёт в run_sync, поэтому функции полей, как и раньше,
+    получают синхронную Session и могут делать в ней запросы."""
+    return await session.run_sync(
+        lambda sync_session: quest.data_generator(
+            model, fileds, count, sync_session, bulk, batch_size
+        )
+    )
+
+
+async def init_database(session: AsyncSession, chunk_size: int = 10000):
+    await session.run_sync(quest.init_database, chunk_size)
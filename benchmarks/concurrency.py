@@ -0,0 +1,73 @@
+"""Пропускная способность отчётов при росте числа потоков-воркеров.
+
+Воркеры берут сессии из общего scoped_session (quest.get_scoped_session)
+и соединения из пула общего engine.
+
+    python -m benchmarks.concurrency --workers 1 2 4 8 16
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import quest
+
+
+def worker(url: str, profile: str, deadline: float) -> int:
+    registry = quest.get_scoped_session(url, profile)
+    done = 0
+    try:
+        while time.perf_counter() < deadline:
+            registry().execute(quest.task_cost_select()).all()
+            registry.commit()
+            done += 1
+    finally:
+        registry.remove()
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--profile', default='readonly-analytics')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    url = f'sqlite:///{path}'
+    seed_engine = quest.create_db_engine(url, profile='bulk-load')
+    quest.Base.metadata.create_all(seed_engine)
+    with quest.Session(seed_engine) as session:
+        quest.init_database(session, scale=args.scale)
+    seed_engine.dispose()
+
+    results = {}
+    try:
+        for workers in args.workers:
+            barrier = threading.Barrier(workers)
+
+            def run():
+                barrier.wait()
+                return worker(url, args.profile,
+                              time.perf_counter() + args.seconds)
+
+            with ThreadPoolExecutor(workers) as pool:
+                done = sum(pool.map(lambda _: run(), range(workers)))
+            pool_status = quest.get_engine(url, args.profile).pool.status()
+            results[workers] = {
+                'queries_per_sec': done / args.seconds,
+                'pool': pool_status,
+            }
+    finally:
+        quest.dispose_engines()
+        os.remove(path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
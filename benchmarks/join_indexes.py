@@ -0,0 +1,111 @@
+"""Задержка join запросов до и после индексов на внешних ключах.
+
+    python -m benchmarks.join_indexes --rows 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+from quest import Base, Product, ProductQuantity, Task, User, UserTask
+
+INDEXES = [
+    index
+    for table in Base.metadata.sorted_tables
+    for index in table.indexes
+]
+
+
+def fill(engine, rows: int, batch_size: int = 50000) -> None:
+    rng = random.Random(0)
+    tasks = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(rows // 10)]
+    products = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(10000)]
+    users = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(rows // 100)]
+    with engine.begin() as connection:
+        connection.execute(insert(Task), [
+            {'id': id_, 'name': 'task'} for id_ in tasks])
+        connection.execute(insert(Product), [
+            {'id': id_, 'name': 'product', 'barcode': barcode,
+             'price': rng.randint(20, 99999)}
+            for barcode, id_ in enumerate(products)])
+        connection.execute(insert(User), [
+            {'id': id_, 'name': 'user', 'password': 1} for id_ in users])
+        connection.execute(insert(UserTask), [
+            {'user_id': user, 'task_id': task}
+            for user in users for task in rng.sample(tasks, 10)])
+        for start in range(0, rows, batch_size):
+            connection.execute(insert(ProductQuantity), [
+                {'task_id': rng.choice(tasks),
+                 'product_id': rng.choice(products),
+                 'quantity': rng.randint(0, 99999)}
+                for _ in range(min(batch_size, rows - start))])
+
+
+def measure(engine, repeat: int) -> dict[str, float]:
+    with engine.connect() as connection:
+        tasks = connection.scalars(
+            select(Task.id).order_by(func.random()).limit(repeat)).all()
+        users = connection.scalars(
+            select(User.id).order_by(func.random()).limit(repeat)).all()
+        task_cost = (
+            select(Task.id, func.avg(Product.price),
+                   func.sum(Product.price * ProductQuantity.quantity))
+            .select_from(Task)
+            .join(ProductQuantity)
+            .join(Product)
+            .group_by(Task.id)
+        )
+        user_tasks = select(Task.id).join(UserTask)
+        timings = {}
+        started = time.perf_counter()
+        for task in tasks:
+            connection.execute(task_cost.where(Task.id == task)).all()
+        timings['task_cost_ms'] = (
+            (time.perf_counter() - started) * 1000 / len(tasks))
+        started = time.perf_counter()
+        for user in users:
+            connection.execute(user_tasks.where(UserTask.user_id == user)).all()
+        timings['user_tasks_ms'] = (
+            (time.perf_counter() - started) * 1000 / len(users))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='строк в productquantity')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for index in INDEXES:
+            index.drop(connection)
+    fill(engine, args.rows)
+
+    before = measure(engine, args.repeat)
+    with engine.begin() as connection:
+        for index in INDEXES:
+            index.create(connection)
+        connection.execute(text('ANALYZE'))
+    after = measure(engine, args.repeat)
+    engine.dispose()
+    os.remove(path)
+
+    print(json.dumps({
+        'rows': args.rows,
+        'before': before,
+        'after': after,
+        'speedup': {key: before[key] / after[key] for key in before},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Бенчмарки заполнения, join и агрегации на данных разного масштаба.
+
+    python -m benchmarks.suite run --scale 10 --output new.json
+    python -m benchmarks.suite compare old.json new.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+import quest
+from quest import Device, DeviceTask, Product, Task, User, UserTask
+
+REPORTS = {
+    'do_select': quest.do_select,
+    'select_users_who_use_devices': quest.select_users_who_use_devices,
+    'select_count_product_id_avg_price_sum_price':
+        quest.select_count_product_id_avg_price_sum_price,
+}
+
+
+class LineCounter:
+    """Подменяет stdout отчётов и считает напечатанные строки."""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count('\n')
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def traced_peak_mb(function, *args) -> tuple[object, float]:
+    """Результат function и пик выделенной Python памяти за её вызов, МиБ.
+
+    ru_maxrss хранит пик за всю жизнь процесса, и все фазы после самой
+    тяжёлой показывали бы одно и то же число. tracemalloc.reset_peak()
+    отсчитывает пик каждой фазы заново. Память самой SQLite (кэш
+    страниц) tracemalloc не видит."""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, peak / 2 ** 20
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    samples = sorted(samples)
+    if len(samples) == 1:
+        return {'p50': samples[0], 'p90': samples[0], 'p99': samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p90': cuts[89], 'p99': cuts[98]}
+
+
+def link_tasks(session: Session, per_owner: int = 5) -> None:
+    """init_database не создаёт связей, без них join отчётов пусты."""
+    rng = random.Random(0)
+    tasks = session.scalars(select(Task.id)).all()
+    for model, link, column in ((User, UserTask, 'user_id'),
+                                (Device, DeviceTask, 'device_id')):
+        session.execute(insert(link), [
+            {column: owner, 'task_id': task}
+            for owner in session.scalars(select(model.id))
+            for task in rng.sample(tasks, min(per_owner, len(tasks)))
+        ])
+    session.commit()
+
+
+def bench_seeding(session: Session, scale: float) -> dict:
+    """Заполнение выполняется один раз, поэтому время в нём меряется
+    под tracemalloc, одинаково от запуска к запуску."""
+    result, peak = traced_peak_mb(_seed, session, scale)
+    result['peak_traced_mb'] = peak
+    return result
+
+
+def _seed(session: Session, scale: float) -> dict:
+    started = time.perf_counter()
+    quest.init_database(session, scale=scale)
+    link_tasks(session)
+    seeded = time.perf_counter() - started
+    rows = round(10000 * scale)
+    rates = {}
+    codes = quest.barcodes(session)
+    for bulk in (False, True):
+        rates['bulk' if bulk else 'orm'] = quest.data_generator(
+            model=Product,
+            fileds={
+                'name': lambda *_: ''.join(random.choices(
+                    string.ascii_lowercase, k=12)),
+                'barcode': lambda *_: next(codes),
+                'price': lambda *_: random.randint(20, 99999),
+            },
+            count=rows,
+            session=session,
+            bulk=bulk,
+        )
+    return {
+        'init_database_sec': seeded,
+        'data_generator_rows': rows,
+        'data_generator_rows_per_sec': rates,
+    }
+
+
+def bench_report(session: Session, report, repeat: int) -> dict:
+    latencies = []
+    counter = LineCounter()
+    for _ in range(repeat):
+        session.expunge_all()
+        counter.lines = 0
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(counter):
+            report(session)
+        latencies.append((time.perf_counter() - started) * 1000)
+    # Память отдельным прогоном: tracemalloc замедлил бы замеры времени.
+    session.expunge_all()
+    with contextlib.redirect_stdout(LineCounter()):
+        _, peak = traced_peak_mb(report, session)
+    return {
+        'latency_ms': percentiles(latencies),
+        'rows': counter.lines,
+        'rows_per_sec': counter.lines / (statistics.median(latencies) / 1000),
+        'peak_traced_mb': peak,
+    }
+
+
+def run(scale: float, repeat: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    engine = quest.create_db_engine(f'sqlite:///{path}', profile='bulk-load')
+    quest.Base.metadata.create_all(engine)
+    try:
+        with Session(engine) as session:
+            result = {
+                'scale': scale,
+                'repeat': repeat,
+                'seeding': bench_seeding(session, scale),
+                'reports': {
+                    name: bench_report(session, report, repeat)
+                    for name, report in REPORTS.items()
+                },
+            }
+    finally:
+        engine.dispose()
+        os.remove(path)
+    return result
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """Отчёты, у которых p50 или p90 выросли больше чем на threshold."""
+    regressions = []
+    for name, report in new['reports'].items():
+        before = old['reports'].get(name)
+        if before is None:
+            continue
+        for key in ('p50', 'p90'):
+            was = before['latency_ms'][key]
+            now = report['latency_ms'][key]
+            if was and (now - was) / was > threshold:
+                regressions.append(
+                    f'{name} {key}: {was:.2f} -> {now:.2f} ms '
+                    f'(+{(now - was) / was:.0%})'
+                )
+    for mode, was in old['seeding']['data_generator_rows_per_sec'].items():
+        now = new['seeding']['data_generator_rows_per_sec'].get(mode)
+        if now is not None and (was - now) / was > threshold:
+            regressions.append(
+                f'data_generator {mode}: {was:.0f} -> {now:.0f} rows/s'
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--scale', type=float, default=1)
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--output')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report = json.dumps(run(args.scale, args.repeat), indent=2)
+        if args.output:
+            with open(args.output, 'w') as file:
+                file.write(report)
+        print(report)
+        return
+
+    with open(args.old) as old, open(args.new) as new:
+        regressions = compare(json.load(old), json.load(new), args.threshold)
+    for line in regressions:
+        print(line)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Скорость вставки и размер индекса первичного ключа: uuid4 против uuid7.
+
+    python -m benchmarks.uuid_keys --rows 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from uuid import uuid4
+
+from sqlalchemy import create_engine, insert, text
+
+from quest import Base, ProductQuantity, uuid7
+
+FACTORIES = {'uuid4': uuid4, 'uuid7': uuid7}
+
+
+def run(factory, rows: int, batch_size: int) -> dict[str, float]:
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    engine = create_engine(f'sqlite:///{path}')
+    table = ProductQuantity.__table__
+    Base.metadata.create_all(engine, tables=[table])
+    product_id, task_id = uuid4(), uuid4()
+
+    started = time.perf_counter()
+    for start in range(0, rows, batch_size):
+        with engine.begin() as connection:
+            connection.execute(insert(table), [
+                {'id': factory(), 'product_id': product_id,
+                 'task_id': task_id, 'quantity': 1}
+                for _ in range(min(batch_size, rows - start))
+            ])
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as connection:
+        page_size = connection.scalar(text('PRAGMA page_size'))
+        pk_index = connection.scalar(text(
+            "SELECT name FROM sqlite_master "
+            "WHERE tbl_name = 'productquantity' "
+            "AND name LIKE 'sqlite_autoindex%'"
+        ))
+        # dbstat есть не в каждой сборке SQLite, тогда меряем весь файл.
+        try:
+            index_pages = connection.scalar(
+                text('SELECT count(*) FROM dbstat WHERE name = :name'),
+                {'name': pk_index},
+            )
+        except Exception:
+            index_pages = None
+    engine.dispose()
+    file_size = os.path.getsize(path)
+    os.remove(path)
+    return {
+        'rows_per_sec': rows / elapsed,
+        'pk_index_bytes': index_pages * page_size if index_pages else None,
+        'file_bytes': file_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+    print(json.dumps({
+        name: run(factory, args.rows, args.batch_size)
+        for name, factory in FACTORIES.items()
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
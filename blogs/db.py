@@ -0,0 +1,21 @@
+"""Общие на процесс engine и фабрики сессий блога."""
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from blogs.settings import DB_URL
+from engines import EngineRegistry
+
+_registry = EngineRegistry()
+
+
+def get_engine(url: str = DB_URL) -> Engine:
+    """Один engine с пулом engines.POOL_SETTINGS на url."""
+    return _registry.get_engine(url)
+
+
+def get_sessionmaker(url: str = DB_URL) -> sessionmaker[Session]:
+    return _registry.get_sessionmaker(url)
+
+
+def dispose_engines() -> None:
+    _registry.dispose()
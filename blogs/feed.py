@@ -0,0 +1,191 @@
+"""Домашняя лента для моделей blogs.models.
+
+Push: при публикации id поста записывается в timeline каждого
+подписчика, и чтение ленты это один проход по индексу. Pull: если
+у автора в момент публикации подписчиков больше FANOUT_LIMIT, пост
+не рассылается, помечается fanned_out = false и читается из постов
+автора при открытии ленты. Решение хранится в посте, поэтому пост
+не пропадает, когда число подписчиков потом меняется. Страницы листаются
+курсором по (created_at, post_id), без OFFSET.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, delete, func, insert, literal, select, tuple_, \
+    update
+from sqlalchemy.orm import Session
+
+from blogs.models import NODE_BITS, Post, TimelineEntry, User, next_id, \
+    subs_table
+
+FANOUT_LIMIT = 10000
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{post_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    created_at, post_id = base64.urlsafe_b64decode(cursor).decode().split('|')
+    return datetime.fromisoformat(created_at), int(post_id)
+
+
+def follow(session: Session, follower_id: int, followed_id: int,
+           backfill: int = 50) -> None:
+    """Подписка с переносом последних backfill постов в ленту."""
+    session.execute(insert(subs_table).values(
+        follower_id=follower_id, followed_id=followed_id,
+    ))
+    session.execute(
+        update(User).where(User.id == followed_id)
+        .values(followers_count=User.followers_count + 1)
+    )
+    recent = (
+        select(literal(follower_id), Post.created_at, Post.id)
+        .where(Post.user_id == followed_id, Post.fanned_out)
+        .order_by(Post.created_at.desc())
+        .limit(backfill)
+    )
+    session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'created_at', 'post_id'], recent,
+    ))
+    session.commit()
+
+
+def unfollow(session: Session, follower_id: int, followed_id: int) -> None:
+    session.execute(delete(subs_table).where(
+        subs_table.c.follower_id == follower_id,
+        subs_table.c.followed_id == followed_id,
+    ))
+    session.execute(
+        update(User).where(User.id == followed_id)
+        .values(followers_count=User.followers_count - 1)
+    )
+    session.execute(delete(TimelineEntry).where(
+        TimelineEntry.user_id == follower_id,
+        TimelineEntry.post_id.in_(
+            select(Post.id).where(Post.user_id == followed_id)
+        ),
+    ))
+    session.commit()
+
+
+def publish(session: Session, author_id: int, title: str, text: str,
+            fanout_limit: int = FANOUT_LIMIT) -> Post:
+    """Сохраняет пост и, если автор не слишком популярен, рассылает
+    его одним INSERT ... SELECT по подписчикам."""
+    followers_count = session.scalar(
+        select(User.followers_count).where(User.id == author_id)
+    )
+    post = Post(title=title, text=text, user_id=author_id,
+                created_at=datetime.now(),
+                fanned_out=followers_count <= fanout_limit)
+    session.add(post)
+    session.flush()
+    if post.fanned_out:
+        session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'created_at', 'post_id'],
+            select(subs_table.c.follower_id,
+                   literal(post.created_at), literal(post.id))
+            .where(subs_table.c.followed_id == author_id),
+        ))
+    session.commit()
+    return post
+
+
+def ingest_posts(
+        session: Session,
+        posts: list[dict],
+        batch_size: int = 10000,
+        fanout_limit: int = FANOUT_LIMIT,
+) -> int:
+    """Пакетная загрузка постов (dict с user_id, title, text, created_at).
+
+    Ключи каждой пачки берутся одним блоком next_id.block, строки
+    пишутся Core executemany, а рассылка по лентам идёт одним
+    INSERT ... SELECT на пачку: блок выделяет диапазон ключей,
+    и посты пачки находятся по нему без списка id в параметрах."""
+    written = 0
+    for start in range(0, len(posts), batch_size):
+        batch = posts[start:start + batch_size]
+        ids = next_id.block(len(batch))
+        followers = dict(session.execute(
+            select(User.id, User.followers_count)
+            .where(User.id.in_({row['user_id'] for row in batch}))
+        ).all())
+        session.execute(insert(Post), [
+            {'created_at': datetime.now(), **row, 'id': id_,
+             'fanned_out': followers[row['user_id']] <= fanout_limit}
+            for id_, row in zip(ids, batch)
+        ])
+        in_block = and_(
+            Post.id.between(ids.start, ids[-1]),
+            Post.id % (1 << NODE_BITS) == next_id.node,
+        )
+        session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'created_at', 'post_id'],
+            select(subs_table.c.follower_id, Post.created_at, Post.id)
+            .join(subs_table, subs_table.c.followed_id == Post.user_id)
+            .where(in_block, Post.fanned_out),
+        ))
+        session.commit()
+        written += len(batch)
+    return written
+
+
+def home_timeline(
+        session: Session,
+        user_id: int,
+        limit: int = 20,
+        cursor: str | None = None,
+) -> tuple[list[Post], str | None]:
+    """Страница ленты и курсор следующей страницы (None, если конец)."""
+    after = decode_cursor(cursor) if cursor else None
+
+    pushed = (
+        select(TimelineEntry.created_at, TimelineEntry.post_id)
+        .where(TimelineEntry.user_id == user_id)
+    )
+    pulled = (
+        select(Post.created_at, Post.id)
+        .join(subs_table, and_(
+            subs_table.c.followed_id == Post.user_id,
+            subs_table.c.follower_id == user_id,
+        ))
+        .where(Post.fanned_out.is_(False))
+    )
+    if after is not None:
+        pushed = pushed.where(
+            tuple_(TimelineEntry.created_at, TimelineEntry.post_id)
+            < tuple_(*after)
+        )
+        pulled = pulled.where(
+            tuple_(Post.created_at, Post.id) < tuple_(*after)
+        )
+    keys = set(session.execute(
+        pushed.order_by(TimelineEntry.created_at.desc(),
+                        TimelineEntry.post_id.desc()).limit(limit)
+    ).tuples())
+    keys.update(session.execute(
+        pulled.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+    ).tuples())
+    page = sorted(keys, reverse=True)[:limit]
+    if not page:
+        return [], None
+
+    posts = {
+        post.id: post
+        for post in session.scalars(
+            select(Post).where(Post.id.in_([post_id for _, post_id in page]))
+        )
+    }
+    next_cursor = encode_cursor(*page[-1]) if len(page) == limit else None
+    return [posts[post_id] for _, post_id in page], next_cursor
+
+
+def timeline_size(session: Session, user_id: int) -> int:
+    return session.scalar(
+        select(func.count()).select_from(TimelineEntry)
+        .where(TimelineEntry.user_id == user_id)
+    )
@@ -0,0 +1,145 @@
+"""Обход графа подписок blogs.models пачками: один запрос на уровень.
+
+Вместо ленивой загрузки User.following по одному пользователю
+соседи всего фронтира BFS берутся одним IN запросом по индексам subs.
+Для горячих пользователей есть AdjacencyCache со списками соседей
+в компактных целочисленных массивах.
+"""
+from array import array
+from collections.abc import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+
+from blogs.models import subs_table
+
+# Ниже лимита параметров SQLite (999 в старых сборках).
+IN_BATCH = 900
+
+
+def following_of(session: Session, user_ids: Iterable[int]) -> dict[int, list]:
+    """На кого подписан каждый из user_ids."""
+    user_ids = list(user_ids)
+    result = {user_id: [] for user_id in user_ids}
+    for start in range(0, len(user_ids), IN_BATCH):
+        rows = session.execute(
+            select(subs_table.c.follower_id, subs_table.c.followed_id)
+            .where(subs_table.c.follower_id.in_(
+                user_ids[start:start + IN_BATCH]
+            ))
+        )
+        for follower_id, followed_id in rows:
+            result[follower_id].append(followed_id)
+    return result
+
+
+class AdjacencyCache:
+    """Списки подписок горячих пользователей в массивах array('I').
+
+    64-битные id заменяются плотными 32-битными кодами, так что список
+    из N подписок занимает 4N байт вместо N объектов int."""
+
+    def __init__(self):
+        self._codes: dict[int, int] = {}
+        self._ids: list[int] = []
+        self._following: dict[int, array] = {}
+
+    def _code(self, user_id: int) -> int:
+        code = self._codes.get(user_id)
+        if code is None:
+            code = self._codes[user_id] = len(self._ids)
+            self._ids.append(user_id)
+        return code
+
+    def load(self, session: Session, user_ids: Iterable[int]) -> None:
+        for user_id, followed in following_of(session, user_ids).items():
+            self._following[self._code(user_id)] = array(
+                'I', map(self._code, followed)
+            )
+
+    def invalidate(self, user_id: int) -> None:
+        code = self._codes.get(user_id)
+        if code is not None:
+            self._following.pop(code, None)
+
+    def get(self, user_id: int) -> list[int] | None:
+        code = self._codes.get(user_id)
+        if code is None or code not in self._following:
+            return None
+        return [self._ids[followed] for followed in self._following[code]]
+
+
+def bfs(
+        session: Session,
+        user_id: int,
+        depth: int = 2,
+        cache: AdjacencyCache | None = None,
+) -> dict[int, int]:
+    """Расстояние до всех пользователей в пределах depth подписок."""
+    distances = {user_id: 0}
+    frontier = [user_id]
+    for level in range(1, depth + 1):
+        neighbours = {}
+        missing = []
+        for node in frontier:
+            cached = cache.get(node) if cache is not None else None
+            if cached is None:
+                missing.append(node)
+            else:
+                neighbours[node] = cached
+        neighbours.update(following_of(session, missing))
+        frontier = []
+        for followed in neighbours.values():
+            for node in followed:
+                if node not in distances:
+                    distances[node] = level
+                    frontier.append(node)
+        if not frontier:
+            break
+    return distances
+
+
+def second_degree(session: Session, user_id: int) -> set[int]:
+    """Подписки подписок, кроме себя и тех, на кого уже подписан."""
+    return {
+        node for node, distance in bfs(session, user_id, 2).items()
+        if distance == 2
+    }
+
+
+def mutual_follows(session: Session, user_id: int) -> list[int]:
+    """Пользователи, подписанные друг на друга с user_id."""
+    outgoing = aliased(subs_table)
+    incoming = aliased(subs_table)
+    return session.scalars(
+        select(outgoing.c.followed_id)
+        .join(incoming, (incoming.c.follower_id == outgoing.c.followed_id)
+              & (incoming.c.followed_id == user_id))
+        .where(outgoing.c.follower_id == user_id)
+    ).all()
+
+
+def who_to_follow(
+        session: Session,
+        user_id: int,
+        limit: int = 10,
+) -> list[tuple[int, int]]:
+    """Кандидаты второго круга с числом общих связей, одним запросом."""
+    first = aliased(subs_table)
+    second = aliased(subs_table)
+    already = select(subs_table.c.followed_id).where(
+        subs_table.c.follower_id == user_id
+    )
+    mutual = func.count().label('mutual')
+    return session.execute(
+        select(second.c.followed_id, mutual)
+        .join(first, first.c.followed_id == second.c.follower_id)
+        .where(
+            first.c.follower_id == user_id,
+            second.c.followed_id != user_id,
+            second.c.followed_id.not_in(already),
+        )
+        .group_by(second.c.followed_id)
+        .order_by(mutual.desc(), second.c.followed_id)
+        .limit(limit)
+    ).tuples().all()
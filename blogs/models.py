@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, \
+    Index, Integer, String, Table
+from sqlalchemy.orm import declarative_base, relationship
+
+from blogs.db import get_engine
+from blogs.settings import DB_URL
+
+Base = declarative_base()
+
+# 2020-01-01 UTC, мс. С ним 41 бита времени хватает до 2089 года.
+ID_EPOCH_MS = 1577836800000
+NODE_BITS = 10
+SEQ_BITS = 12
+
+
+class IdAllocator:
+    """64-битные ключи: мс от ID_EPOCH_MS, счётчик в мс и номер узла.
+
+    Номер узла стоит в младших битах, поэтому ключи одного узла идут
+    с шагом 2**NODE_BITS, а блок из n ключей это range, который
+    резервируется за O(1) под блокировкой. Ключи растут со временем,
+    вставки дописываются в конец индекса. Разные процессы, пишущие
+    в одну базу, должны получать разные node."""
+
+    def __init__(self, node: int = 0):
+        if not 0 <= node < 1 << NODE_BITS:
+            raise ValueError(f'node должен быть в [0, {1 << NODE_BITS})')
+        self.node = node
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, count: int) -> int:
+        with self._lock:
+            now = (time.time_ns() // 1_000_000 - ID_EPOCH_MS) << SEQ_BITS
+            # Если время отстаёт (или блок занял будущие мс), идём
+            # от последнего выданного значения, как uuid7 в quest.
+            start = max(now, self._last + 1)
+            self._last = start + count - 1
+        return start
+
+    def __call__(self) -> int:
+        return self._reserve(1) << NODE_BITS | self.node
+
+    def block(self, count: int) -> range:
+        """count ключей для пакетной вставки без обращения к базе."""
+        start = self._reserve(count)
+        return range(
+            start << NODE_BITS | self.node,
+            (start + count) << NODE_BITS | self.node,
+            1 << NODE_BITS,
+        )
+
+
+next_id = IdAllocator(node=int(os.environ.get("BLOGS_NODE_ID", 0)))
+
+# В SQLite INTEGER PRIMARY KEY это сам rowid: без отдельного индекса.
+IdType = BigInteger().with_variant(Integer(), "sqlite")
+
+# Первичный ключ обслуживает "на кого подписан", индекс "кто подписан".
+subs_table = Table(
+    "subs",
+    Base.metadata,
+    Column("follower_id", IdType, ForeignKey("users.id"),
+           primary_key=True),
+    Column("followed_id", IdType, ForeignKey("users.id"),
+           primary_key=True),
+    Index("ix_subs_followed_id_follower_id", "followed_id", "follower_id"),
+)
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(IdType, primary_key=True, default=next_id)
+    name = Column(String)
+    email = Column(String, unique=True)
+    password = Column(String)
+    # Поддерживается feed.follow/unfollow, по нему выбирается режим ленты.
+    followers_count = Column(Integer, nullable=False, default=0)
+
+    posts = relationship("Post", back_populates="user")
+    followers = relationship(
+        "User",
+        secondary=subs_table,
+        primaryjoin=id == subs_table.c.followed_id,
+        secondaryjoin=id == subs_table.c.follower_id,
+        backref="following",
+    )
+
+    def __repr__(self):
+        return f'User(name={self.name}, email={self.email})'
+
+
+class Post(Base):
+    __tablename__ = "posts"
+
+    id = Column(IdType, primary_key=True, default=next_id)
+    title = Column(String)
+    text = Column(String)
+    user_id = Column(IdType, ForeignKey("users.id"))
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    # Разослан ли пост в timeline подписчиков при публикации. Неразосланные
+    # посты лента дочитывает из постов автора (см. blogs.feed).
+    fanned_out = Column(Boolean, nullable=False, default=True)
+
+    user = relationship("User", back_populates="posts")
+
+    __table_args__ = (
+        Index("ix_posts_user_id_created_at", "user_id", "created_at"),
+    )
+
+
+class TimelineEntry(Base):
+    """Пост в домашней ленте подписчика, записывается при публикации."""
+    __tablename__ = "timeline"
+
+    user_id = Column(IdType, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime, primary_key=True)
+    post_id = Column(IdType, ForeignKey("posts.id"), primary_key=True)
+
+
+if __name__ == "__main__":
+    print("creating db")
+    engine = get_engine(DB_URL)
+    Base.metadata.create_all(engine)
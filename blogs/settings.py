@@ -0,0 +1 @@
+DB_URL = "sqlite:///blogs.sqlite3"
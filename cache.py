@@ -0,0 +1,135 @@
+"""Кэш результатов отчётных запросов с инвалидацией по таблицам.
+
+Ключ записи: база, скомпилированный SQL и его параметры. Запись помнит,
+какие таблицы читал запрос, и удаляется, как только в одну из них
+пишут. Записи отслеживаются событиями Engine, поэтому ловятся и flush
+сессии, и bulk/Core вставки. Сырые text() запросы не отслеживаются,
+после них нужен clear().
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import Engine, Select, event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+
+_caches: 'weakref.WeakSet[QueryCache]' = weakref.WeakSet()
+
+
+def database_key(engine: Engine) -> str | Engine:
+    """Ключ базы engine: url, а для SQLite в памяти сам engine,
+    у таких баз одинаковый url, но у каждого engine своя база."""
+    database = engine.url.database
+    if engine.dialect.name == 'sqlite' and database in (None, '', ':memory:'):
+        return engine
+    return engine.url.render_as_string(hide_password=True)
+
+
+class QueryCache:
+    """LRU кэш строк с TTL и ограничениями на число записей и строк."""
+
+    def __init__(
+            self,
+            maxsize: int = 256,
+            ttl: float = 60.0,
+            max_rows: int = 100000,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._entries: OrderedDict[tuple, tuple[float, set, tuple]] = \
+            OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def rows(self, session: Session, statement: Select) -> tuple[tuple, ...]:
+        """Строки statement из кэша или из базы.
+
+        Кэшируются только выборки колонок: ORM объекты привязаны
+        к сессии и не могут переиспользоваться."""
+        if any(isinstance(column['expr'], type)
+               for column in statement.column_descriptions):
+            raise ValueError('QueryCache кэширует только выборки колонок')
+        connection = session.connection()
+        compiled = statement.compile(dialect=connection.dialect)
+        key = (
+            database_key(connection.engine),
+            str(compiled),
+            repr(sorted(compiled.params.items())),
+        )
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        rows = tuple(tuple(row) for row in session.execute(statement))
+        # Незакоммиченные записи этой транзакции не должны попасть
+        # в кэш, их не видят другие соединения.
+        if len(rows) <= self.max_rows and \
+                not connection.info.get('written_tables'):
+            tables = {
+                table.name
+                for table in find_tables(
+                    statement, check_columns=True, include_aliases=True
+                )
+            }
+            with self._lock:
+                # Пока шёл запрос, таблицы могли измениться и закоммититься.
+                if generation != self._generation:
+                    return rows
+                self._entries[key] = (now + self.ttl, tables, rows)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return rows
+
+    def invalidate(self, tables: set[str]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, (_, read, _) in self._entries.items()
+                        if read & tables]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def _invalidate(tables: set[str]) -> None:
+    for cache in list(_caches):
+        cache.invalidate(tables)
+
+
+@event.listens_for(Engine, 'before_execute')
+def _track_writes(connection, clauseelement, *_) -> None:
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    tables = {clauseelement.table.name}
+    connection.info.setdefault('written_tables', set()).update(tables)
+    _invalidate(tables)
+
+
+@event.listens_for(Engine, 'commit')
+def _invalidate_on_commit(connection) -> None:
+    # Читатели других соединений могли закэшировать старое состояние
+    # между записью и коммитом, сбрасываем ещё раз.
+    tables = connection.info.pop('written_tables', None)
+    if tables:
+        _invalidate(tables)
+
+
+@event.listens_for(Engine, 'rollback')
+def _forget_writes_on_rollback(connection) -> None:
+    connection.info.pop('written_tables', None)
@@ -0,0 +1,86 @@
+"""Общие на процесс engine, фабрики сессий и scoped_session.
+
+Модуль не зависит от моделей, его используют и quest, и blogs:
+у каждого свой EngineRegistry со своей функцией создания engine.
+"""
+import threading
+from collections.abc import Callable, Hashable
+
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+# Настройки QueuePool для engine из EngineRegistry.get_engine.
+POOL_SETTINGS: dict[str, object] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+
+class EngineRegistry:
+    """Engine и фабрики сессий по ключу (url, *args).
+
+    :argument create создаёт engine: create(url, *args, **pool)"""
+
+    def __init__(self, create: Callable[..., Engine] = create_engine):
+        self.create = create
+        self._lock = threading.Lock()
+        self._engines: dict[tuple[Hashable, ...], Engine] = {}
+        self._session_factories: \
+            dict[tuple[Hashable, ...], sessionmaker[Session]] = {}
+        self._scoped_sessions: \
+            dict[tuple[Hashable, ...], scoped_session[Session]] = {}
+
+    def get_engine(self, url: str, *args: Hashable, **pool) -> Engine:
+        """Настройки пула берутся из POOL_SETTINGS, pool переопределяет
+        их только при первом создании engine."""
+        key = (url, *args)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                parsed = make_url(url)
+                # Для базы в памяти SQLAlchemy выбирает SingletonThreadPool,
+                # настройки QueuePool ему не подходят.
+                in_memory = parsed.get_backend_name() == 'sqlite' and \
+                    parsed.database in (None, '', ':memory:')
+                settings = {} if in_memory else {**POOL_SETTINGS, **pool}
+                engine = self.create(url, *args, **settings)
+                self._engines[key] = engine
+        return engine
+
+    def get_sessionmaker(self, url: str, *args: Hashable) \
+            -> sessionmaker[Session]:
+        engine = self.get_engine(url, *args)
+        key = (url, *args)
+        with self._lock:
+            factory = self._session_factories.get(key)
+            if factory is None:
+                factory = sessionmaker(engine)
+                self._session_factories[key] = factory
+        return factory
+
+    def get_scoped_session(self, url: str, *args: Hashable) \
+            -> scoped_session[Session]:
+        """Потокобезопасная сессия: у каждого потока своя Session.
+
+        Поток-воркер по окончании работы должен вызвать remove()."""
+        factory = self.get_sessionmaker(url, *args)
+        key = (url, *args)
+        with self._lock:
+            registry = self._scoped_sessions.get(key)
+            if registry is None:
+                registry = scoped_session(factory)
+                self._scoped_sessions[key] = registry
+        return registry
+
+    def dispose(self) -> None:
+        with self._lock:
+            for registry in self._scoped_sessions.values():
+                registry.remove()
+            for engine in self._engines.values():
+                engine.dispose()
+            self._scoped_sessions.clear()
+            self._session_factories.clear()
+            self._engines.clear()
@@ -0,0 +1,204 @@
+"""Отложенная пакетная запись ProductQuantity от приборов.
+
+Отчёты приборов не пишутся по одному (одна транзакция и fsync на
+событие, как в add_task), а копятся в памяти. Фоновый поток сворачивает
+события одной пары (задача, продукт) в одну строку и коммитит их
+группой, когда набралось max_batch событий или прошло interval секунд.
+"""
+import atexit
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy import Engine, insert
+
+from quest import Base, ProductQuantity, add_task_costs
+
+logger = logging.getLogger('quest.ingest')
+
+
+class QuantityIngestor:
+    """Буфер событий с групповым коммитом в фоновом потоке.
+
+    :argument max_batch сколько событий вызывает запись без ожидания
+        и сколько строк пишется одной транзакцией
+    :argument interval наибольшая задержка события в буфере, секунды
+    :argument max_pending сколько событий может ждать записи, дальше
+        submit блокируется (обратное давление)
+    :argument max_attempts сколько раз пробовать записать пачку;
+        после этого она уходит в dead_letters, а flush() и close()
+        сообщают о потере
+
+    close() (или выход из with, или завершение интерпретатора)
+    дописывает всё принятое. Количество событий одной пары
+    складывается, как складывает их отчёт по quantity."""
+
+    def __init__(
+            self,
+            engine: Engine,
+            max_batch: int = 10000,
+            interval: float = 0.05,
+            max_pending: int = 100000,
+            max_attempts: int = 5,
+    ):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.flushes = 0
+        self.rows = 0
+        self.error: Exception | None = None
+        # Пачки, которые так и не удалось записать: пара -> quantity.
+        self.dead_letters: list[dict[tuple[uuid.UUID, uuid.UUID], int]] = []
+        # Пара -> [quantity, число событий].
+        self._pending: dict[tuple[uuid.UUID, uuid.UUID], list[int]] = {}
+        self._events = 0
+        self._received = 0
+        self._done = 0
+        self._lost = 0
+        self._reported_lost = 0
+        self._flush_target = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='quantity-ingestor', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> 'QuantityIngestor':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def submit(
+            self,
+            task_id: uuid.UUID,
+            product_id: uuid.UUID,
+            quantity: int,
+            timeout: float | None = None,
+    ) -> None:
+        """Принимает событие; ждёт, пока буфер переполнен.
+
+        TimeoutError, если место не освободилось за timeout секунд."""
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._events < self.max_pending or self._closed,
+                    timeout,
+            ):
+                raise TimeoutError('очередь записи переполнена')
+            if self._closed:
+                raise RuntimeError('QuantityIngestor закрыт')
+            pending = self._pending.setdefault((task_id, product_id), [0, 0])
+            pending[0] += quantity
+            pending[1] += 1
+            self._events += 1
+            self._received += 1
+            if self._events >= self.max_batch:
+                self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Ждёт, пока все события, принятые до вызова, будут записаны
+        или уйдут в dead_letters."""
+        with self._condition:
+            target = self._received
+            self._flush_target = max(self._flush_target, target)
+            self._condition.notify_all()
+            if not self._condition.wait_for(
+                    lambda: self._done >= target or
+                    not self._thread.is_alive(),
+                    timeout,
+            ):
+                raise TimeoutError('события не записаны за timeout')
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        """Перестаёт принимать события и дописывает буфер."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        with self._condition:
+            lost = self._lost - self._reported_lost
+            self._reported_lost = self._lost
+        if lost:
+            raise RuntimeError(
+                f'не записано событий: {lost}, пачки в dead_letters'
+            ) from self.error
+
+    def _ready(self) -> bool:
+        return self._events >= self.max_batch or self._closed or \
+            self._flush_target > self._done
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._ready, self.interval)
+                if not self._pending:
+                    if self._closed:
+                        return
+                    continue
+                # Не больше max_batch строк в транзакции.
+                batch = dict(itertools.islice(self._pending.items(),
+                                              self.max_batch))
+                for key in batch:
+                    del self._pending[key]
+                events = sum(count for _, count in batch.values())
+                self._events -= events
+                # Место в буфере освободилось, будим ждущих в submit.
+                self._condition.notify_all()
+            self._write_with_retries(
+                {key: quantity for key, (quantity, _) in batch.items()},
+                events,
+            )
+
+    def _write_with_retries(
+            self,
+            batch: dict[tuple[uuid.UUID, uuid.UUID], int],
+            events: int,
+    ) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._write(batch)
+            except Exception as error:
+                logger.exception('запись %d событий не удалась, попытка %d '
+                                 'из %d', events, attempt, self.max_attempts)
+                with self._condition:
+                    self.error = error
+                if attempt < self.max_attempts:
+                    # Пауза растёт с каждой попыткой.
+                    time.sleep(self.interval * attempt)
+                continue
+            with self._condition:
+                self._done += events
+                self.error = None
+                self._condition.notify_all()
+            return
+        logger.error('%d событий отложены в dead_letters', events)
+        with self._condition:
+            self.dead_letters.append(batch)
+            self._done += events
+            self._lost += events
+            self._condition.notify_all()
+
+    def _write(self, batch: dict[tuple[uuid.UUID, uuid.UUID], int]) -> None:
+        rows = [
+            {'id': Base.id_factory(), 'task_id': task_id,
+             'product_id': product_id, 'quantity': quantity}
+            for (task_id, product_id), quantity in batch.items()
+        ]
+        with self.engine.begin() as connection:
+            connection.execute(insert(ProductQuantity.__table__), rows)
+            # Core вставка обходит события сессии, итоги задач
+            # дополняем вкладом новых строк в той же транзакции.
+            add_task_costs(connection, rows)
+        self.flushes += 1
+        self.rows += len(rows)
@@ -0,0 +1,161 @@
+"""Статистика запросов, журнал медленных запросов и поиск N+1.
+
+Вместо echo=True: событиями курсора Engine меряется каждый запрос,
+запросы группируются по отпечатку (SQL без литералов), а медленные
+пишутся в журнал вместе с EXPLAIN QUERY PLAN.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger('quest.queries')
+
+# Верхние границы корзин гистограммы, мс.
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000, float('inf'))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> str:
+    """SQL без литералов и с IN (?, ?, ...) свёрнутыми в IN (?...)."""
+    statement = _LITERALS.sub('?', statement)
+    statement = _IN_LISTS.sub('(?...)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+@dataclass
+class FingerprintStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    histogram: list[int] = field(
+        default_factory=lambda: [0] * len(BUCKETS_MS)
+    )
+
+    def add(self, elapsed_ms: float, rows: int) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += max(rows, 0)
+        self.histogram[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-квантиль."""
+        target = q * self.count
+        seen = 0
+        for bound, hits in zip(BUCKETS_MS, self.histogram):
+            seen += hits
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class QueryStats:
+    """Подключается к Engine через attach().
+
+    :argument slow_ms порог журнала медленных запросов
+    :argument n_plus_one сколько одинаковых SELECT в одной транзакции
+        считать признаком N+1
+    """
+
+    def __init__(
+            self,
+            slow_ms: float = 100.0,
+            n_plus_one: int = 20,
+            explain: bool = True,
+    ):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self.explain = explain
+        self.stats: dict[str, FingerprintStats] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine) -> 'QueryStats':
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'begin', self._reset_repeats)
+        return self
+
+    def report(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                key: {
+                    'count': item.count,
+                    'total_ms': item.total_ms,
+                    'mean_ms': item.total_ms / item.count,
+                    'p50_ms': item.percentile(0.5),
+                    'p99_ms': item.percentile(0.99),
+                    'max_ms': item.max_ms,
+                    'rows': item.rows,
+                }
+                for key, item in sorted(
+                    self.stats.items(),
+                    key=lambda pair: pair[1].total_ms,
+                    reverse=True,
+                )
+            }
+
+    @staticmethod
+    def _reset_repeats(connection) -> None:
+        connection.info['query_repeats'] = {}
+
+    @staticmethod
+    def _before(connection, cursor, statement, parameters, context,
+                executemany) -> None:
+        connection.info.setdefault('query_started', []).append(
+            time.perf_counter()
+        )
+
+    def _after(self, connection, cursor, statement, parameters, context,
+               executemany) -> None:
+        elapsed_ms = (
+            time.perf_counter() - connection.info['query_started'].pop()
+        ) * 1000
+        # Для SELECT в SQLite rowcount равен -1 до выборки строк.
+        key = fingerprint(statement)
+        with self._lock:
+            self.stats.setdefault(key, FingerprintStats()).add(
+                elapsed_ms, cursor.rowcount
+            )
+
+        if elapsed_ms >= self.slow_ms:
+            logger.warning(
+                'slow query %.1f ms: %s %r%s',
+                elapsed_ms, statement, parameters,
+                self._plan(connection, statement, parameters, executemany),
+            )
+
+        if statement.lstrip()[:6].upper() != 'SELECT':
+            return
+        repeats = connection.info.setdefault('query_repeats', {})
+        repeats[key] = repeats.get(key, 0) + 1
+        if repeats[key] == self.n_plus_one:
+            logger.warning(
+                'possible N+1: %d identical queries in one transaction: %s',
+                repeats[key], key,
+            )
+
+    def _plan(self, connection, statement, parameters, executemany) -> str:
+        if not self.explain or executemany or \
+                statement.lstrip()[:6].upper() != 'SELECT':
+            return ''
+        prefix = ('EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite'
+                  else 'EXPLAIN ')
+        # Курсор DBAPI напрямую, чтобы EXPLAIN не попал в статистику.
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = '\n'.join(' '.join(map(str, row)) for row in cursor)
+        except Exception as error:
+            plan = f'EXPLAIN failed: {error}'
+        finally:
+            cursor.close()
+        return '\n' + plan
@@ -0,0 +1,136 @@
+"""Постраничные листинги по ключу (keyset) вместо OFFSET.
+
+Следующая страница выбирается условием (date, id) > (последняя строка),
+которое идёт по индексу, поэтому сотая страница стоит столько же,
+сколько первая. Курсор непрозрачный: base64 от JSON со значениями
+ключа последней строки и именами колонок, по которым он построен.
+"""
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Sequence
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+from quest import Product, Task, UserTask
+
+
+class Page(NamedTuple):
+    items: list
+    # None, если страница последняя.
+    next_cursor: str | None
+
+
+def _dump(value):
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _load(column: InstrumentedAttribute, value):
+    python_type = column.type.python_type
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _key_names(keys: Sequence[InstrumentedAttribute]) -> list[str]:
+    return [str(key) for key in keys]
+
+
+def encode_cursor(
+        keys: Sequence[InstrumentedAttribute],
+        values: Sequence,
+) -> str:
+    raw = json.dumps([_key_names(keys), [_dump(value) for value in values]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(
+        keys: Sequence[InstrumentedAttribute],
+        cursor: str,
+) -> list:
+    """Значения ключа из курсора, ValueError для чужого или битого."""
+    try:
+        names, values = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError, TypeError) as error:
+        raise ValueError('некорректный курсор') from error
+    if names != _key_names(keys) or len(values) != len(keys):
+        raise ValueError('курсор построен для другого листинга')
+    return [_load(key, value) for key, value in zip(keys, values)]
+
+
+def paginate(
+        session: Session,
+        statement: Select,
+        keys: Sequence[InstrumentedAttribute],
+        limit: int = 50,
+        cursor: str | None = None,
+        descending: bool = False,
+) -> Page:
+    """Страница statement в порядке keys.
+
+    :argument keys колонки порядка, последняя должна быть уникальной
+        (обычно id), чтобы порядок был полным
+    :argument descending все ключи по убыванию, смешанный порядок
+        не поддерживается"""
+    if cursor is not None:
+        after = tuple_(*keys)
+        bound = tuple_(*decode_cursor(keys, cursor))
+        statement = statement.where(after < bound if descending
+                                    else after > bound)
+    order = [key.desc() for key in keys] if descending else list(keys)
+    # Значения ключа выбираются лишними колонками в конце строки.
+    rows = session.execute(
+        statement.add_columns(*keys).order_by(*order).limit(limit)
+    ).all()
+    width = len(rows[0]) - len(keys) if rows else 0
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(keys, rows[-1][width:])
+    return Page(items, next_cursor)
+
+
+def list_tasks(
+        session: Session,
+        limit: int = 50,
+        cursor: str | None = None,
+        descending: bool = True,
+) -> Page:
+    """Задачи по Task.date, по умолчанию новые первыми."""
+    return paginate(session, select(Task), (Task.date, Task.id),
+                    limit, cursor, descending)
+
+
+def list_products(
+        session: Session,
+        limit: int = 50,
+        cursor: str | None = None,
+) -> Page:
+    """Каталог продуктов в порядке первичного ключа."""
+    return paginate(session, select(Product), (Product.id,), limit, cursor)
+
+
+def list_user_tasks(
+        session: Session,
+        user_id: uuid.UUID,
+        limit: int = 50,
+        cursor: str | None = None,
+        descending: bool = True,
+) -> Page:
+    """Задачи пользователя по Task.date."""
+    return paginate(
+        session,
+        select(Task).join(UserTask, UserTask.task_id == Task.id)
+        .where(UserTask.user_id == user_id),
+        (Task.date, Task.id), limit, cursor, descending,
+    )
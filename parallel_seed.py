@@ -0,0 +1,224 @@
+"""Параллельное заполнение базы: строки генерируют процессы,
+пишут в базу только писатели, владеющие соединениями."""
+import os
+import random
+import string
+import uuid
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy import Engine, func, insert, select
+
+from quest import Device, Product, ProductQuantity, Task, User, \
+    refresh_task_costs
+
+
+def random_string(
+        rng: random.Random,
+        alphabet: str,
+        min_len: int,
+        max_len: int,
+        prefix: str = '',
+) -> str:
+    length = rng.randint(min_len, max_len)
+    return prefix + ''.join(rng.choices(alphabet, k=length))
+
+
+def random_int(rng: random.Random, a: int, b: int) -> int:
+    return rng.randint(a, b)
+
+
+# Время первичных ключей по умолчанию: ключи зависят только от seed,
+# а не от момента запуска.
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def time_ordered_uuid(rng: random.Random, ms: int, seq: int = 0) -> uuid.UUID:
+    """UUID в раскладке uuid7 из quest с заданными миллисекундами.
+
+    Ключи растут вместе с ms и seq, как у quest.uuid7, поэтому вставки
+    дописываются в конец индекса первичного ключа, а остальные биты
+    берутся из rng пачки и воспроизводятся вместе с ней."""
+    rand_b = rng.getrandbits(62)
+    return uuid.UUID(
+        int=ms << 80 | 0x7 << 76 | (seq & 0xFFF) << 64 | 0b10 << 62 | rand_b
+    )
+
+
+# Те же распределения, что и в init_database, но с явным rng,
+# чтобы результат зависел только от master seed.
+FIELDS: dict[str, dict[str, Callable[[random.Random], object]]] = {
+    User.__tablename__: {
+        'name': partial(random_string, alphabet=string.ascii_lowercase,
+                        min_len=7, max_len=24),
+        'password': partial(random_int, a=100000000, b=999999999),
+    },
+    Product.__tablename__: {
+        'name': partial(random_string, alphabet=string.ascii_lowercase,
+                        min_len=7, max_len=24),
+        'price': partial(random_int, a=20, b=99999),
+    },
+    Device.__tablename__: {
+        'name': partial(random_string, alphabet=string.hexdigits,
+                        min_len=3, max_len=12, prefix='SKF_'),
+        'description': partial(random_string,
+                               alphabet=string.ascii_letters + ' ',
+                               min_len=24, max_len=170),
+    },
+    Task.__tablename__: {
+        'name': partial(random_string, alphabet=string.ascii_lowercase,
+                        min_len=7, max_len=24),
+    },
+}
+
+TABLES = {
+    model.__tablename__: model.__table__
+    for model in (User, Product, Device, Task, ProductQuantity)
+}
+
+DEFAULT_COUNTS = {
+    User.__tablename__: 150,
+    Product.__tablename__: 1300,
+    Device.__tablename__: 50,
+    Task.__tablename__: 70,
+}
+
+_product_ids: list[uuid.UUID] = []
+
+
+def _init_worker(product_ids: list[uuid.UUID]) -> None:
+    global _product_ids
+    _product_ids = product_ids
+
+
+def build_batch(
+        table: str,
+        seed: int,
+        index: int,
+        size: int,
+        offset: int = 0,
+        first_barcode: int = 0,
+        base_ms: int = int(BASE_TIME.timestamp() * 1000),
+) -> dict[str, list[dict]]:
+    """Строит пачку строк для table.
+
+    Генератор пачки зависит только от (seed, table, index), поэтому
+    результат не зависит от числа процессов и порядка их работы.
+    offset номер первой строки пачки в таблице: строка получает
+    ключ с временем base_ms + номер строки, а продукт штрихкод
+    first_barcode + номер строки."""
+    rng = random.Random(f'{seed}:{table}:{index}')
+    fields = FIELDS[table]
+    rows = []
+    quantities = []
+    for number in range(offset, offset + size):
+        row = {'id': time_ordered_uuid(rng, base_ms + number)}
+        for filed, func in fields.items():
+            row[filed] = func(rng)
+        if table == Product.__tablename__:
+            row['barcode'] = first_barcode + number
+        rows.append(row)
+        if table == Task.__tablename__:
+            for line in range(rng.randint(1, 15)):
+                quantities.append({
+                    'id': time_ordered_uuid(rng, base_ms + number, line),
+                    'task_id': row['id'],
+                    'product_id': rng.choice(_product_ids),
+                    'quantity': rng.randint(0, 99999),
+                })
+    batch = {table: rows}
+    if quantities:
+        batch[ProductQuantity.__tablename__] = quantities
+    return batch
+
+
+def write_batch(engine: Engine, batch: dict[str, list[dict]]) -> int:
+    """Пишет пачку в одной транзакции, таблицы в порядке вставки."""
+    with engine.begin() as connection:
+        for table, rows in batch.items():
+            connection.execute(insert(TABLES[table]), rows)
+    return sum(len(rows) for rows in batch.values())
+
+
+def _batches(
+        count: int,
+        batch_size: int,
+) -> Iterator[tuple[int, int]]:
+    for index, start in enumerate(range(0, count, batch_size)):
+        yield index, min(batch_size, count - start)
+
+
+def _run(
+        engine: Engine,
+        pool: ProcessPoolExecutor,
+        tables: list[str],
+        counts: dict[str, int],
+        seed: int,
+        batch_size: int,
+        writers: int,
+        base_ms: int,
+        first_barcode: int = 0,
+) -> int:
+    jobs = [
+        (table, seed, index, size, index * batch_size, first_barcode, base_ms)
+        for table in tables
+        for index, size in _batches(counts.get(table, 0), batch_size)
+    ]
+    batches = pool.map(build_batch, *zip(*jobs)) if jobs else []
+    # SQLite допускает одного писателя: пишем из главного потока.
+    if engine.dialect.name == 'sqlite' or writers == 1:
+        return sum(write_batch(engine, batch) for batch in batches)
+    with ThreadPoolExecutor(writers) as writer_pool:
+        return sum(writer_pool.map(partial(write_batch, engine), batches))
+
+
+def parallel_init_database(
+        engine: Engine,
+        seed: int = 0,
+        counts: dict[str, int] | None = None,
+        workers: int | None = None,
+        writers: int | None = None,
+        batch_size: int = 10000,
+        base_time: datetime = BASE_TIME,
+) -> int:
+    """Параллельный аналог init_database.
+
+    :argument seed master seed, одинаковый seed даёт одинаковые данные
+    :argument base_time время первого первичного ключа каждой таблицы
+    :argument workers число процессов-генераторов
+    :argument writers число писателей для серверных баз, у каждого
+        своё соединение из пула engine
+    :return число вставленных строк"""
+    counts = counts or DEFAULT_COUNTS
+    workers = workers or os.cpu_count() or 1
+    writers = writers or workers
+    base_ms = int(base_time.timestamp() * 1000)
+    with engine.connect() as connection:
+        last_barcode = connection.scalar(select(func.max(Product.barcode)))
+    with ProcessPoolExecutor(workers) as pool:
+        written = _run(
+            engine, pool,
+            [User.__tablename__, Product.__tablename__,
+             Device.__tablename__],
+            counts, seed, batch_size, writers, base_ms,
+            max(last_barcode or 0, 99999999) + 1,
+        )
+    with engine.connect() as connection:
+        product_ids = sorted(connection.scalars(select(Product.id)).all())
+    if not product_ids:
+        return written
+    with ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(product_ids,),
+    ) as pool:
+        written += _run(
+            engine, pool, [Task.__tablename__],
+            counts, seed, batch_size, writers, base_ms,
+        )
+    # Core вставки обходят события сессии, пересобираем итоги целиком.
+    with engine.begin() as connection:
+        refresh_task_costs(connection)
+    return written
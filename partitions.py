@@ -0,0 +1,286 @@
+"""Помесячные партиции task и productquantity в отдельных файлах SQLite.
+
+Текущие месяцы живут в основных таблицах. Закрытый месяц переносится
+partition_month() в свой файл task_ГГГГ_ММ.sqlite3 вместе со строками
+заказа и связями задач. Отчёты за период подключают (ATTACH) только
+файлы месяцев, пересекающих период, так что их стоимость зависит
+от окна, а не от всей истории. Удалить или убрать в архив месяц
+значит удалить или переместить один файл.
+"""
+import os
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import Column, Connection, Engine, Index, MetaData, Table, \
+    delete, func, insert, select, text, tuple_, union_all
+from sqlalchemy.orm import Session
+
+from quest import DeviceTask, Product, ProductQuantity, Task, \
+    TaskCostSummary, UserTask
+
+# Таблицы, строки которых принадлежат задаче, в порядке вставки.
+PARTITIONED = tuple(
+    model.__table__ for model in (Task, ProductQuantity, UserTask, DeviceTask)
+)
+
+# SQLite по умолчанию разрешает не больше 10 подключённых баз.
+MAX_ATTACHED = 8
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    if month.month == 12:
+        return datetime(month.year + 1, 1, 1)
+    return datetime(month.year, month.month + 1, 1)
+
+
+def _partition_table(table: Table, metadata: MetaData, schema: str) -> Table:
+    # Внешние ключи между файлами SQLite невозможны, копируем только
+    # колонки и индексы, нужные отсечению по дате и соединениям.
+    partition = Table(
+        table.name, metadata,
+        *(Column(column.name, column.type, primary_key=column.primary_key,
+                 nullable=column.nullable) for column in table.c),
+        schema=schema,
+    )
+    if table.name == Task.__tablename__:
+        Index(f'ix_{table.name}_date_id', partition.c.date, partition.c.id)
+    else:
+        Index(f'ix_{table.name}_task_id', partition.c.task_id)
+    return partition
+
+
+def _partition_tables(schema: str) -> dict[str, Table]:
+    metadata = MetaData()
+    return {
+        table.name: _partition_table(table, metadata, schema)
+        for table in PARTITIONED
+    }
+
+
+def _owned_by(table: Table, task_ids):
+    """Условие на строки table, принадлежащие задачам task_ids."""
+    if table is Task.__table__:
+        return table.c.id.in_(task_ids)
+    return table.c.task_id.in_(task_ids)
+
+
+class MonthPartitions:
+    """Маршрутизация запросов по файлам месяцев в directory.
+
+    Только для SQLite. Подключения сделанных файлов живут на уровне
+    DBAPI соединения пула и переиспользуются между сессиями, лишние
+    отключаются по давности использования."""
+
+    def __init__(self, directory: str | os.PathLike,
+                 max_attached: int = MAX_ATTACHED):
+        self.directory = Path(directory)
+        self.max_attached = max_attached
+        self._tables: dict[str, dict[str, Table]] = {}
+
+    @staticmethod
+    def schema(month: datetime) -> str:
+        return f'p_{month:%Y_%m}'
+
+    def path(self, month: datetime) -> Path:
+        return self.directory / f'task_{month:%Y_%m}.sqlite3'
+
+    def months(self) -> list[datetime]:
+        return sorted(
+            datetime.strptime(path.stem, 'task_%Y_%m')
+            for path in self.directory.glob('task_[0-9]*_[0-9]*.sqlite3')
+        )
+
+    def months_between(self, start: datetime, end: datetime) -> list[datetime]:
+        """Месяцы с файлами, пересекающие [start, end)."""
+        return [month for month in self.months()
+                if month < end and next_month(month) > start]
+
+    def tables(self, month: datetime) -> dict[str, Table]:
+        schema = self.schema(month)
+        tables = self._tables.get(schema)
+        if tables is None:
+            tables = self._tables[schema] = _partition_tables(schema)
+        return tables
+
+    def attach(self, connection: Connection, month: datetime) -> None:
+        """Подключает файл месяца к соединению, если он ещё не подключён.
+
+        ATTACH и DETACH невозможны внутри транзакции, поэтому
+        вызывать до первой записи в соединении."""
+        attached: dict[str, Path] = connection.connection.info.setdefault(
+            'month_partitions', {}
+        )
+        # Файлы, удалённые drop() или archive(), отключаем.
+        for schema, path in list(attached.items()):
+            if not path.exists():
+                connection.exec_driver_sql(f'DETACH DATABASE {schema}')
+                del attached[schema]
+        schema = self.schema(month)
+        if schema in attached:
+            attached[schema] = attached.pop(schema)
+            return
+        while len(attached) >= self.max_attached:
+            oldest = next(iter(attached))
+            connection.exec_driver_sql(f'DETACH DATABASE {oldest}')
+            del attached[oldest]
+        connection.execute(
+            text(f'ATTACH DATABASE :path AS {schema}'),
+            {'path': str(self.path(month))},
+        )
+        attached[schema] = self.path(month)
+
+    def source_groups(
+            self,
+            connection: Connection,
+            start: datetime,
+            end: datetime,
+    ) -> Iterator[list[dict[str, Table]]]:
+        """Основные таблицы и таблицы месяцев, пересекающих [start, end),
+        группами не больше max_attached месяцев.
+
+        Месяцы группы подключены, пока не запрошена следующая группа,
+        поэтому запрос по группе нужно выполнить до этого. Месяцы вне
+        периода не подключаются и не читаются."""
+        months = self.months_between(start, end)
+        groups = [months[first:first + self.max_attached]
+                  for first in range(0, len(months), self.max_attached)]
+        main = {table.name: table for table in PARTITIONED}
+        for number, group in enumerate(groups or [[]]):
+            for month in group:
+                self.attach(connection, month)
+            tables = [self.tables(month) for month in group]
+            yield [main, *tables] if number == 0 else tables
+
+    def partition_month(self, engine: Engine, month: datetime) -> int:
+        """Переносит задачи месяца из основных таблиц в файл месяца.
+
+        В WAL режиме коммит в несколько подключённых баз не атомарен,
+        поэтому перенос идёт тремя шагами, каждый атомарен сам по себе:
+        строки копируются в невидимый отчётам файл .partial, из основных
+        таблиц удаляются только скопированные строки, и файл
+        переименовывается в файл месяца. После падения на любом шаге
+        месяц не виден отчётам дважды, а повторный вызов доделывает
+        перенос. Итоги TaskCostSummary перенесённых задач удаляются,
+        отчёты по периоду считают их по строкам заказа.
+
+        :return число скопированных строк"""
+        month = month_start(month)
+        if month_start(datetime.now()) <= month:
+            raise ValueError('переносить можно только закрытый месяц')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        final = self.path(month)
+        partial = final.with_suffix('.partial')
+        if final.exists():
+            if partial.exists():
+                raise RuntimeError(f'есть и {final.name}, и {partial.name}')
+            # Дописываем поздние строки месяца, убрав файл из отчётов.
+            os.replace(final, partial)
+
+        schema = self.schema(month) + '_partial'
+        tables = _partition_tables(schema)
+        task = Task.__table__
+        task_ids = select(task.c.id).where(
+            task.c.date >= month, task.c.date < next_month(month)
+        )
+        with engine.connect() as connection:
+            connection.execute(
+                text(f'ATTACH DATABASE :path AS {schema}'),
+                {'path': str(partial)},
+            )
+            try:
+                for table in tables.values():
+                    table.create(connection, checkfirst=True)
+                connection.commit()
+
+                moved = 0
+                for table in PARTITIONED:
+                    moved += connection.execute(
+                        insert(tables[table.name]).prefix_with('OR IGNORE')
+                        .from_select(table.c.keys(),
+                                     select(table).where(
+                                         _owned_by(table, task_ids)))
+                    ).rowcount
+                connection.commit()
+
+                summary = TaskCostSummary.__table__
+                connection.execute(
+                    delete(summary).where(summary.c.task_id.in_(task_ids))
+                )
+                for table in reversed(PARTITIONED):
+                    copied = tables[table.name]
+                    key = tuple_(*table.primary_key.columns)
+                    connection.execute(delete(table).where(key.in_(
+                        select(*(copied.c[column.name]
+                                 for column in table.primary_key.columns))
+                    )))
+                left = sum(
+                    connection.scalar(
+                        select(func.count()).select_from(table)
+                        .where(_owned_by(table, task_ids))
+                    )
+                    for table in PARTITIONED
+                )
+                if left:
+                    connection.rollback()
+                    raise RuntimeError(
+                        f'за время переноса появилось строк месяца: {left}, '
+                        f'повторите partition_month'
+                    )
+                connection.commit()
+            finally:
+                connection.rollback()
+                connection.exec_driver_sql(f'DETACH DATABASE {schema}')
+        os.replace(partial, final)
+        return moved
+
+    def drop(self, month: datetime) -> None:
+        """Удаляет месяц целиком, это одно удаление файла."""
+        self.path(month_start(month)).unlink(missing_ok=True)
+
+    def archive(self, month: datetime, destination: str | os.PathLike) -> Path:
+        """Перемещает файл месяца в destination, вне маршрутизации."""
+        path = self.path(month_start(month))
+        target = Path(destination) / path.name
+        os.replace(path, target)
+        return target
+
+
+def task_costs_between(
+        session: Session,
+        partitions: MonthPartitions,
+        start: datetime,
+        end: datetime,
+) -> list[tuple]:
+    """(task_id, avg_price, total_cost) задач с date в [start, end),
+    как select_count_product_id_avg_price_sum_price, по всем
+    подходящим партициям.
+
+    Партиции читаются одним UNION ALL на группу подключённых вместе
+    месяцев. Задача со строками целиком лежит в одной партиции,
+    поэтому результаты групп просто складываются."""
+    product = Product.__table__
+    rows = []
+    for group in partitions.source_groups(session.connection(), start, end):
+        parts = []
+        for tables in group:
+            task = tables[Task.__tablename__]
+            quantity = tables[ProductQuantity.__tablename__]
+            parts.append(
+                select(
+                    quantity.c.task_id,
+                    func.avg(product.c.price).label('avg_price'),
+                    func.sum(product.c.price * quantity.c.quantity)
+                    .label('total_cost'),
+                )
+                .join(task, task.c.id == quantity.c.task_id)
+                .join(product, product.c.id == quantity.c.product_id)
+                .where(task.c.date >= start, task.c.date < end)
+                .group_by(quantity.c.task_id)
+            )
+        rows += session.execute(union_all(*parts)).tuples().all()
+    return rows
@@ -1,21 +1,170 @@
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
 
+import os
+from collections import namedtuple
+import itertools
 import string
+import threading
+import time
+import uuid
 from datetime import datetime
 import random
-from typing import Optional
-from uuid import uuid4
+from typing import ClassVar, NamedTuple, Optional
 
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import Delete, Insert
+from sqlalchemy.sql.elements import BindParameter, ClauseElement
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import declared_attr, DeclarativeBase, Mapped, \
-    mapped_column, relationship, Session, joinedload
-from sqlalchemy import ForeignKey, create_engine, UUID, Uuid, select
+    mapped_column, relationship, Session, selectinload, attributes, \
+    sessionmaker, scoped_session
+from sqlalchemy import ForeignKey, create_engine, UUID, Uuid, select, insert, \
+    update, event, Engine, BigInteger, Connection, delete, or_, inspect, \
+    Index, Result
+
+from cache import QueryCache, database_key
+from engines import POOL_SETTINGS, EngineRegistry
+from instrumentation import QueryStats
 
 DB_URL = 'sqlite:///db.sqlite3'
 
+# PRAGMA, которые create_db_engine выставляет каждому новому соединению
+# SQLite. cache_size в отрицательных значениях задаётся в КиБ.
+ENGINE_PROFILES: dict[str, dict[str, object]] = {
+    # Заполнение базы: потеря последних транзакций при падении ОС
+    # допустима, данные можно сгенерировать заново.
+    'bulk-load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 1 << 30,
+        'cache_size': -256000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+    'oltp': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 << 20,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    # Отчёты: большой кэш и mmap, запись в базу запрещена.
+    'readonly-analytics': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 4 << 30,
+        'cache_size': -512000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'query_only': 'ON',
+    },
+}
+
+
+def create_db_engine(
+        url: str = DB_URL,
+        profile: str = 'oltp',
+        echo: bool = False,
+        **kwargs,
+) -> Engine:
+    """create_engine с PRAGMA из ENGINE_PROFILES для SQLite.
+
+    Для остальных баз профиль не применяется."""
+    engine = create_engine(url, echo=echo, **kwargs)
+    apply_engine_profile(engine, profile)
+    return engine
+
+
+def apply_engine_profile(engine: Engine, profile: str) -> None:
+    """Выставляет PRAGMA профиля каждому новому соединению SQLite.
+
+    ValueError для неизвестного профиля, для любой базы."""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(
+            f'Неизвестный профиль {profile!r}, '
+            f'доступны: {", ".join(ENGINE_PROFILES)}'
+        )
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = ENGINE_PROFILES[profile]
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+_registry = EngineRegistry(create_db_engine)
+
+
+def get_engine(url: str = DB_URL, profile: str = 'oltp', **pool) -> Engine:
+    """Общий на процесс engine для (url, profile).
+
+    Настройки пула берутся из POOL_SETTINGS, pool переопределяет их
+    только при первом создании engine."""
+    return _registry.get_engine(url, profile, **pool)
+
+
+def get_sessionmaker(
+        url: str = DB_URL,
+        profile: str = 'oltp',
+) -> sessionmaker[Session]:
+    return _registry.get_sessionmaker(url, profile)
+
+
+def get_scoped_session(
+        url: str = DB_URL,
+        profile: str = 'oltp',
+) -> scoped_session[Session]:
+    """Потокобезопасная сессия: у каждого потока своя Session.
+
+    Поток-воркер по окончании работы должен вызвать remove()."""
+    return _registry.get_scoped_session(url, profile)
+
+
+def dispose_engines() -> None:
+    _registry.dispose()
+
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
+
+
+def uuid7() -> uuid.UUID:
+    """UUID версии 7: впереди 48 бит миллисекунд unix-времени.
+
+    Ключи растут со временем, поэтому вставки дописываются в конец
+    индекса первичного ключа, а не разбрасываются по всему B-дереву.
+    Внутри одной миллисекунды 12-битный счётчик сохраняет порядок."""
+    global _uuid7_last
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, seq = _uuid7_last
+        if ms > last_ms:
+            # Не из модуля random: иначе random.seed() перестаёт
+            # воспроизводить данные init_database.
+            seq = int.from_bytes(os.urandom(2)) >> 5
+        else:
+            ms, seq = last_ms, seq + 1
+            if seq > 0xFFF:
+                ms, seq = ms + 1, 0
+        _uuid7_last = (ms, seq)
+    rand_b = int.from_bytes(os.urandom(8)) & (1 << 62) - 1
+    return uuid.UUID(
+        int=ms << 80 | 0x7 << 76 | seq << 64 | 0b10 << 62 | rand_b
+    )
+
 
 class Base(DeclarativeBase):
-    id: Mapped[UUID] = mapped_column(Uuid, primary_key=True, default=uuid4)
+    # Генератор первичных ключей, можно заменить, например на uuid4.
+    id_factory: ClassVar[Callable[[], uuid.UUID]] = uuid7
+    id: Mapped[UUID] = mapped_column(
+        Uuid, primary_key=True, default=lambda: Base.id_factory()
+    )
 
     @declared_attr.directive
     def __tablename__(cls) -> str:
@@ -27,7 +176,8 @@ class NameMixin:
 
 
 class Product(NameMixin, Base):
-    barcode: Mapped[int]
+    # Ключ синхронизации каталога, см. upsert_products.
+    barcode: Mapped[int] = mapped_column(unique=True, index=True)
     price: Mapped[int]
 
     tasks: Mapped[list['ProductQuantity']] = relationship(
@@ -69,10 +219,13 @@ class Task(NameMixin,Base):
         back_populates='tasks',
     )
 
+    # Порядок листинга задач (date, id), см. pagination.list_tasks.
+    __table_args__ = (Index('ix_task_date_id', 'date', 'id'),)
+
 
 class ProductQuantity(Base):
-    product_id: Mapped[int] = mapped_column(ForeignKey(Product.id))
-    task_id: Mapped[int] = mapped_column(ForeignKey(Task.id))
+    product_id: Mapped[int] = mapped_column(ForeignKey(Product.id), index=True)
+    task_id: Mapped[int] = mapped_column(ForeignKey(Task.id), index=True)
     quantity: Mapped[int | None] = mapped_column(default=None, nullable=True)
     task: Mapped['Task'] = relationship(
         back_populates='products'
@@ -83,28 +236,214 @@ class ProductQuantity(Base):
 
 
 class UserTask(Base):
-    user_id: Mapped[int] = mapped_column(ForeignKey(User.id))
-    task_id: Mapped[int] = mapped_column(ForeignKey(Task.id))
+    # Ключ связи (user_id, task_id) вместо суррогатного Base.id:
+    # дубли невозможны, поиск по user_id идёт по первичному ключу.
+    id = None
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(User.id), primary_key=True
+    )
+    task_id: Mapped[int] = mapped_column(
+        ForeignKey(Task.id), primary_key=True, index=True
+    )
 
 
 class DeviceTask(Base):
-    device_id: Mapped[int] = mapped_column(ForeignKey(Device.id))
-    task_id: Mapped[int] = mapped_column(ForeignKey(Task.id))
+    id = None
+    device_id: Mapped[int] = mapped_column(
+        ForeignKey(Device.id), primary_key=True
+    )
+    task_id: Mapped[int] = mapped_column(
+        ForeignKey(Task.id), primary_key=True, index=True
+    )
 
 
-def do_select(session: Session):
-    request = session.execute(select(User).options(joinedload(User.tasks)))
-    for user in request.unique().scalars().all():
-        print(user.name, user.password, [task.id for task in user.tasks])
+class SeedProgress(Base):
+    """Сколько строк генерации уже закоммичено, для продолжения seed_stream."""
+    key: Mapped[str] = mapped_column(unique=True)
+    committed: Mapped[int] = mapped_column(default=0)
+
+
+class TaskCostSummary(Base):
+    """Готовые итоги select_count_product_id_avg_price_sum_price по задаче.
+
+    Строки пересчитываются после каждого flush, затронувшего
+    ProductQuantity или Product.price (см. refresh_task_costs).
+    total_cost, как и sum() в SQL, NULL, если у всех строк задачи
+    quantity NULL."""
+    id = None
+    task_id: Mapped[UUID] = mapped_column(
+        ForeignKey(Task.id, ondelete='CASCADE'), primary_key=True
+    )
+    total_cost: Mapped[int | None] = mapped_column(BigInteger)
+    price_sum: Mapped[int] = mapped_column(BigInteger)
+    quantity: Mapped[int] = mapped_column(BigInteger)
+    line_items: Mapped[int]
+
+    @hybrid_property
+    def avg_price(self) -> float:
+        return self.price_sum / self.line_items
+
+
+_projections: dict[type[Base], type[tuple]] = {}
+
+
+def projection(model: type[Base]) -> type[tuple]:
+    """Неизменяемый namedtuple с колонками модели: UserRow для User.
+
+    Строки без состояния ORM, identity map и событий, поля доступны
+    по тем же именам, что и атрибуты модели."""
+    row_type = _projections.get(model)
+    if row_type is None:
+        row_type = namedtuple(f'{model.__name__}Row',
+                              model.__table__.c.keys())
+        _projections[model] = row_type
+    return row_type
+
+
+def iter_rows(
+        session: Session,
+        model: type[Base],
+        *where,
+        batch_size: int = 10000,
+) -> Iterator[tuple]:
+    """Потоково читает таблицу model в строки projection(model),
+    минуя ORM: запрос идёт напрямую через соединение сессии."""
+    make = projection(model)._make
+    result = session.connection().execute(
+        select(model.__table__).where(*where)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        yield from map(make, partition)
+
+
+def iter_users_tasks(
+        session: Session,
+        batch_size: int = 1000,
+) -> Iterator[tuple[str, int, list[UUID]]]:
+    """Потоково отдаёт (name, password, [task.id]) пользователей.
+
+    Пользователи читаются курсором пачками по batch_size (yield_per),
+    задачи каждой пачки догружаются одним selectin запросом, так что
+    в памяти не больше одной пачки и нет декартова произведения."""
+    request = session.execute(
+        select(User)
+        .options(selectinload(User.tasks))
+        .execution_options(yield_per=batch_size)
+    )
+    for user in request.scalars():
+        yield user.name, user.password, [task.id for task in user.tasks]
+
+
+def iter_devices_tasks(
+        session: Session,
+        batch_size: int = 1000,
+) -> Iterator[tuple[str, list[UUID]]]:
+    """Потоково отдаёт (name, [task.id]) приборов, как iter_users_tasks."""
+    request = session.execute(
+        select(Device)
+        .options(selectinload(Device.tasks))
+        .execution_options(yield_per=batch_size)
+    )
+    for device in request.scalars():
+        yield device.name, [task.id for task in device.tasks]
+
+
+def graph_loaders(model: type[Base], depth: int,
+                  came_from: type[Base] | None = None) -> list:
+    """selectinload всех связей model на depth уровней вглубь.
+
+    Каждая связь догружается одним IN запросом на пачку родителей
+    (по 500 id), без декартова произведения joinedload. Связи назад,
+    к модели, из которой пришли, не обходятся."""
+    if depth <= 0:
+        return []
+    loaders = []
+    for relationship_ in inspect(model).relationships:
+        target = relationship_.mapper.class_
+        if target is came_from:
+            continue
+        loader = selectinload(getattr(model, relationship_.key))
+        nested = graph_loaders(target, depth - 1, model)
+        loaders.append(loader.options(*nested) if nested else loader)
+    return loaders
+
+
+def load_task_graphs(
+        session: Session,
+        *where,
+        depth: int = 2,
+        batch_size: int = 1000,
+) -> Iterator[Task]:
+    """Потоково отдаёт задачи с заполненными связями.
+
+    depth=1: products, devices и users; depth=2: ещё
+    ProductQuantity.product. Задачи читаются пачками по batch_size,
+    на пачку уходит по запросу на каждую связь, число запросов
+    не зависит от того, сколько связей у отдельной задачи."""
+    request = session.execute(
+        select(Task).where(*where)
+        .options(*graph_loaders(Task, depth))
+        .execution_options(yield_per=batch_size)
+    )
+    yield from request.scalars()
 
 
-def select_users_who_use_devices(session: Session, Device=None):
-    request = session.execute(select(Device).options(joinedload(Device.tasks)))
-    for Device in request.unique().scalars().all():
-        print(User.name, [task.id for task in Device.tasks])
+def links_select(owner: type[User] | type[Device], *columns):
+    """Колонки owner и id его задач, одна строка на связь."""
+    link = UserTask if owner is User else DeviceTask
+    owner_id = link.user_id if owner is User else link.device_id
+    return (
+        select(owner.id, *columns, link.task_id)
+        .outerjoin(link, owner_id == owner.id)
+        .order_by(owner.id)
+    )
 
 
-def select_count_product_id_avg_price_sum_price(session: Session):
+def group_links(rows) -> Iterator[tuple]:
+    """Сворачивает строки links_select в (колонки..., [task.id])."""
+    current = None
+    tasks = []
+    for owner_id, *columns, task_id in rows:
+        if current is not None and owner_id != current[0]:
+            yield *current[1], tasks
+            tasks = []
+        current = owner_id, columns
+        if task_id is not None:
+            tasks.append(task_id)
+    if current is not None:
+        yield *current[1], tasks
+
+
+def do_select(session: Session, cache: QueryCache | None = None):
+    if cache is None:
+        rows = iter_users_tasks(session)
+    else:
+        rows = group_links(cache.rows(
+            session, links_select(User, User.name, User.password)
+        ))
+    for row in rows:
+        print(*row)
+
+
+def select_users_who_use_devices(
+        session: Session,
+        cache: QueryCache | None = None,
+):
+    if cache is None:
+        rows = iter_devices_tasks(session)
+    else:
+        rows = group_links(cache.rows(
+            session, links_select(Device, Device.name)
+        ))
+    for row in rows:
+        print(*row)
+
+
+def select_count_product_id_avg_price_sum_price(
+        session: Session,
+        cache: QueryCache | None = None,
+):
     """
     SELECT task.id, avg(product.price),
     sum(product.price*productquantity.quantity) as Department_price
@@ -117,7 +456,17 @@ def select_count_product_id_avg_price_sum_price(session: Session):
 
     GROUP by task.id
     """
-    response = session.execute(
+    if cache is None:
+        response = session.execute(task_cost_select())
+    else:
+        response = cache.rows(session, task_cost_select())
+
+    for row in response:
+        print(row)
+
+
+def task_cost_select():
+    return (
         select(Task.id, func.sum(Product.price * ProductQuantity.quantity))
         .select_from(Task)
         .join(ProductQuantity)
@@ -125,20 +474,400 @@ def select_count_product_id_avg_price_sum_price(session: Session):
         .group_by(Task.id)
     )
 
+
+def select_task_cost_summary(session: Session):
+    """То же, что select_count_product_id_avg_price_sum_price,
+    но чтением готовой таблицы TaskCostSummary."""
+    response = session.execute(
+        select(
+            TaskCostSummary.task_id,
+            TaskCostSummary.avg_price,
+            TaskCostSummary.total_cost,
+        )
+    )
+
     for row in response:
         print(row)
 
 
-def product_fabric(session: Session) -> list[ProductQuantity]:
-    products = []
-    product_random = session.execute(
-        select(Product.id).offset(random.randint(1, 24)).limit(
-            50)).scalars().all()
+def refresh_task_costs(
+        connection: Connection,
+        task_ids: set[UUID] | None = None,
+        product_ids: set[UUID] | None = None,
+) -> None:
+    """Пересчитывает TaskCostSummary для задач task_ids и задач,
+    в которых есть продукты product_ids. Без аргументов пересобирает
+    таблицу целиком."""
+    summary = TaskCostSummary.__table__
+    lines = (
+        select(
+            ProductQuantity.task_id,
+            func.sum(Product.price * ProductQuantity.quantity),
+            func.sum(Product.price),
+            func.coalesce(func.sum(ProductQuantity.quantity), 0),
+            func.count(),
+        )
+        .join(Product)
+        .group_by(ProductQuantity.task_id)
+    )
+    clear = delete(summary)
+    if task_ids is not None or product_ids is not None:
+        tasks_with_products = select(ProductQuantity.task_id).where(
+            ProductQuantity.product_id.in_(product_ids or ())
+        )
+        lines = lines.where(or_(
+            ProductQuantity.task_id.in_(task_ids or ()),
+            ProductQuantity.task_id.in_(tasks_with_products),
+        ))
+        clear = clear.where(or_(
+            summary.c.task_id.in_(task_ids or ()),
+            summary.c.task_id.in_(tasks_with_products),
+        ))
+    connection.execute(clear)
+    connection.execute(insert(summary).from_select(
+        ['task_id', 'total_cost', 'price_sum', 'quantity', 'line_items'],
+        lines,
+    ))
+
+
+def rebuild_task_costs(session: Session) -> None:
+    refresh_task_costs(session.connection())
+    session.commit()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_task_costs_before_flush(session: Session, *_) -> None:
+    # Старый task_id изменённых и удалённых строк может быть не загружен
+    # (после commit), поэтому берём его из базы одним запросом.
+    line_ids = [
+        inspect(obj).identity[0]
+        for obj in (*session.dirty, *session.deleted)
+        if isinstance(obj, ProductQuantity)
+    ]
+    if line_ids:
+        session.info.setdefault('task_cost_ids', set()).update(
+            session.scalars(
+                select(ProductQuantity.task_id)
+                .where(ProductQuantity.id.in_(line_ids))
+            )
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_task_costs_after_flush(session: Session, _) -> None:
+    task_ids = session.info.pop('task_cost_ids', set())
+    product_ids = set()
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, ProductQuantity):
+            task_ids.add(obj.task_id)
+        elif isinstance(obj, Product) and obj in session.dirty:
+            if attributes.get_history(obj, 'price').has_changes():
+                product_ids.add(obj.id)
+    task_ids.update(
+        inspect(obj).identity[0]
+        for obj in session.deleted if isinstance(obj, Task)
+    )
+    task_ids.discard(None)
+    if task_ids or product_ids:
+        refresh_task_costs(session.connection(), task_ids, product_ids)
+
+
+# Сколько затронутых строк заказа или продуктов выгоднее пересчитать
+# полной пересборкой. Заодно держит списки IN ниже лимита переменных SQLite.
+_REFRESH_ALL_ROWS = 10000
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _refresh_task_costs_bulk(orm_execute_state) -> Result | None:
+    # session.execute(insert/update/delete) минует flush, а с ним
+    # и _refresh_task_costs_after_flush: bulk_insert, seed_stream,
+    # update(Product).values(price=...).
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    statement = state.statement
+    name = getattr(getattr(statement, 'table', None), 'name', None)
+    params = state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+    values = _values(statement)
+    if name == Product.__tablename__ and not state.is_insert:
+        if state.is_update and not any(
+                'price' in row for row in (*rows, *values)):
+            return None
+        products = _matched(state.session, statement, rows,
+                            Product.__table__.c.id)
+        result = state.invoke_statement()
+        if products is None:
+            refresh_task_costs(state.session.connection())
+        elif products:
+            refresh_task_costs(state.session.connection(),
+                               product_ids={id_ for id_, in products})
+        return result
+    if name != ProductQuantity.__tablename__:
+        return None
+
+    if state.is_insert:
+        task_ids = {
+            {**value, **row}.get('task_id')
+            for value in values or [{}] for row in rows or [{}]
+        }
+        result = state.invoke_statement()
+        # INSERT ... SELECT, task_id выражением или вовсе без task_id:
+        # задачи заранее неизвестны, пересобираем всё.
+        refresh_task_costs(state.session.connection(),
+                           None if None in task_ids else task_ids)
+        return result
+    # Задачи строк до изменения и после него (update мог сменить task_id).
+    line = ProductQuantity.__table__
+    lines = _matched(state.session, statement, rows, line.c.id,
+                     line.c.task_id)
+    result = state.invoke_statement()
+    if lines is None:
+        refresh_task_costs(state.session.connection())
+        return result
+    task_ids = {task_id for _, task_id in lines}
+    if state.is_update and lines:
+        task_ids.update(state.session.scalars(
+            select(line.c.task_id)
+            .where(line.c.id.in_([id_ for id_, _ in lines]))
+        ))
+    if task_ids:
+        refresh_task_costs(state.session.connection(), task_ids)
+    return result
+
+
+def _where(statement) -> tuple:
+    return () if statement.whereclause is None else (statement.whereclause,)
+
+
+def _values(statement) -> list[dict]:
+    """Строки, заданные в statement.values() или ordered_values().
+
+    Значение, которое вычисляет сама база (выражение SQL), заменяется
+    на None: до выполнения оно неизвестно."""
+    rows = [getattr(statement, '_values', None) or {},
+            dict(getattr(statement, '_ordered_values', None) or ()),
+            *(row for rows in getattr(statement, '_multi_values', ())
+              for row in rows)]
+    return [
+        {getattr(column, 'key', column):
+            value.effective_value if isinstance(value, BindParameter)
+            else None if isinstance(value, ClauseElement) else value
+         for column, value in row.items()}
+        for row in rows if row
+    ]
+
+
+def _matched(session: Session, statement, rows: list[dict], *columns):
+    """columns строк, которые затронет statement, или None,
+    если их больше _REFRESH_ALL_ROWS.
+
+    Строки executemany по первичному ключу ищутся по id из параметров,
+    остальные по WHERE выражения."""
+    if rows and all('id' in row for row in rows):
+        if len(rows) > _REFRESH_ALL_ROWS:
+            return None
+        matched = (columns[0].table.c.id.in_([row['id'] for row in rows]),)
+    else:
+        matched = _where(statement)
+    found = session.execute(
+        select(*columns).where(*matched).limit(_REFRESH_ALL_ROWS + 1)
+    ).all()
+    return None if len(found) > _REFRESH_ALL_ROWS else found
+
+
+class ProductIdPool:
+    """Id всех продуктов, загруженные один раз и выбираемые в памяти.
+
+    Id хранятся отдельно для каждой базы. Они сбрасываются при любой
+    вставке или удалении в product через Engine (ORM, session.execute,
+    Core и executemany), либо вручную invalidate(). Сырые text()
+    запросы не отслеживаются."""
+    generations: dict[str | Engine, int] = {}
+
+    def __init__(self, rng: random.Random | None = None,
+                 page_size: int = 10000):
+        self.rng = rng or random.Random()
+        self.page_size = page_size
+        self._ids: dict[str | Engine, tuple[int, list[UUID]]] = {}
+
+    @classmethod
+    def invalidate(cls, engine: Engine | None = None) -> None:
+        """Сбрасывает id базы engine, без аргумента всех баз."""
+        keys = list(cls.generations) if engine is None \
+            else [database_key(engine)]
+        for key in keys:
+            cls.generations[key] = cls.generations.get(key, 0) + 1
+
+    def ids(self, session: Session) -> list[UUID]:
+        key = database_key(session.connection().engine)
+        generation = ProductIdPool.generations.setdefault(key, 0)
+        cached = self._ids.get(key)
+        if cached is None or cached[0] != generation:
+            cached = self._ids[key] = (generation, session.scalars(
+                select(Product.id).execution_options(yield_per=self.page_size)
+            ).all())
+        return cached[1]
+
+    def choice(self, session: Session) -> UUID:
+        return self.rng.choice(self.ids(session))
+
+
+@event.listens_for(Engine, 'before_execute')
+def _invalidate_product_ids(connection, clauseelement, *_) -> None:
+    if isinstance(clauseelement, (Insert, Delete)) and \
+            clauseelement.table.name == Product.__tablename__:
+        ProductIdPool.invalidate(connection.engine)
+
+
+product_id_pool = ProductIdPool(rng=random)
+
+# Диалекты с INSERT ... ON CONFLICT.
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+class UpsertResult(NamedTuple):
+    inserted: int
+    updated: int
+    unchanged: int
+
+
+def upsert_products(
+        session: Session,
+        rows: list[dict],
+        batch_size: int = 5000,
+) -> UpsertResult:
+    """Синхронизирует каталог по barcode: строки с barcode, name, price.
+
+    Существующие строки пачки читаются одним IN запросом, совпадающие
+    с базой в запрос не попадают вовсе. Остальные пишутся
+    INSERT ... ON CONFLICT(barcode) DO UPDATE, а условие WHERE
+    в DO UPDATE не даёт перезаписать строку, ставшую тем временем
+    такой же. Итоги задач с изменившейся ценой пересчитываются.
+    При повторе barcode во входных данных побеждает последняя строка."""
+    dialect = session.connection().dialect.name
+    if dialect not in _UPSERT_INSERTS:
+        raise NotImplementedError(f'upsert не поддерживается для {dialect}')
+    table = Product.__table__
+    statement = _UPSERT_INSERTS[dialect](table)
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.barcode],
+        set_={'name': excluded.name, 'price': excluded.price},
+        where=or_(table.c.name != excluded.name,
+                  table.c.price != excluded.price),
+    )
+
+    by_barcode = {row['barcode']: row for row in rows}
+    barcodes = list(by_barcode)
+    inserted = updated = unchanged = 0
+    for start in range(0, len(barcodes), batch_size):
+        batch = barcodes[start:start + batch_size]
+        current = {
+            barcode: (id_, name, price)
+            for id_, barcode, name, price in session.execute(
+                select(table.c.id, table.c.barcode, table.c.name,
+                       table.c.price)
+                .where(table.c.barcode.in_(batch))
+            )
+        }
+        changed = []
+        repriced = set()
+        for barcode in batch:
+            row = by_barcode[barcode]
+            existing = current.get(barcode)
+            if existing is None:
+                inserted += 1
+                changed.append({
+                    'id': Base.id_factory(), 'barcode': barcode,
+                    'name': row['name'], 'price': row['price'],
+                })
+            elif existing[1:] == (row['name'], row['price']):
+                unchanged += 1
+            else:
+                updated += 1
+                changed.append({
+                    'id': existing[0], 'barcode': barcode,
+                    'name': row['name'], 'price': row['price'],
+                })
+                if existing[2] != row['price']:
+                    repriced.add(existing[0])
+        if changed:
+            session.execute(statement, changed)
+        if repriced:
+            refresh_task_costs(session.connection(), product_ids=repriced)
+    session.commit()
+    return UpsertResult(inserted, updated, unchanged)
+
+
+def add_task_costs(connection: Connection, lines: list[dict]) -> None:
+    """Прибавляет к TaskCostSummary вклад новых строк заказа lines
+    (task_id, product_id, quantity), не пересчитывая задачи по всем
+    их строкам.
+
+    Итог задачи обновляется INSERT ... ON CONFLICT DO UPDATE, для
+    остальных диалектов задачи пересчитываются refresh_task_costs."""
+    task_ids = {line['task_id'] for line in lines}
+    dialect = connection.dialect.name
+    if dialect not in _UPSERT_INSERTS:
+        refresh_task_costs(connection, task_ids)
+        return
+    prices = dict(connection.execute(
+        select(Product.id, Product.price)
+        .where(Product.id.in_({line['product_id'] for line in lines}))
+    ).all())
+    deltas = {}
+    for line in lines:
+        price = prices.get(line['product_id'])
+        if price is None:
+            # Без продукта строка не попадает и в task_cost_select().
+            continue
+        delta = deltas.setdefault(line['task_id'], {
+            'task_id': line['task_id'], 'total_cost': None,
+            'price_sum': 0, 'quantity': 0, 'line_items': 0,
+        })
+        if line['quantity'] is not None:
+            delta['total_cost'] = \
+                (delta['total_cost'] or 0) + price * line['quantity']
+            delta['quantity'] += line['quantity']
+        delta['price_sum'] += price
+        delta['line_items'] += 1
+    if not deltas:
+        return
+    summary = TaskCostSummary.__table__
+    statement = _UPSERT_INSERTS[dialect](summary)
+    excluded = statement.excluded
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[summary.c.task_id],
+        set_={
+            # NULL + x даёт NULL, а sum() пропускает NULL.
+            'total_cost': func.coalesce(
+                summary.c.total_cost + excluded.total_cost,
+                summary.c.total_cost, excluded.total_cost,
+            ),
+            'price_sum': summary.c.price_sum + excluded.price_sum,
+            'quantity': summary.c.quantity + excluded.quantity,
+            'line_items': summary.c.line_items + excluded.line_items,
+        },
+    ), list(deltas.values()))
+
 
-    for _ in range(random.randint(1, 15)):
+def barcodes(session: Session) -> Iterator[int]:
+    """Свободные штрихкоды подряд после наибольшего в базе."""
+    last = session.scalar(select(func.max(Product.barcode)))
+    return itertools.count(max(last or 0, 99999999) + 1)
+
+
+def product_fabric(
+        session: Session,
+        pool: ProductIdPool = product_id_pool,
+) -> list[ProductQuantity]:
+    products = []
+    rng = pool.rng
+    for _ in range(rng.randint(1, 15)):
         product_quantity = ProductQuantity(
-            quantity=random.randint(0, 99999),
-            product_id=random.choice(product_random),
+            quantity=rng.randint(0, 99999),
+            product_id=pool.choice(session),
         )
         products.append(product_quantity)
 
@@ -149,17 +878,122 @@ def data_generator(
         model: Base,
         fileds: dict[str, Callable],
         count: int,
-        session: Session
-) -> None:
+        session: Session,
+        bulk: bool = False,
+        batch_size: int = 1000,
+) -> float:
     """Генерирует записи соответственно введённой функции.
 
-    :argument model ORM модель Sqlalchemy"""
-    for _ in range(count):
-        data = dict()
-        for filed, func in fileds.items():
-            data[filed] = func(session)
-        session.add(model(**data))
-    session.commit()
+    :argument model ORM модель Sqlalchemy
+    :argument bulk вставлять строки словарями через executemany,
+        минуя unit of work, с коммитом каждой пачки из batch_size строк
+    :return скорость вставки, строк в секунду"""
+    started = time.perf_counter()
+    if bulk:
+        bulk_insert(model, fileds, count, session, batch_size)
+    else:
+        for _ in range(count):
+            data = dict()
+            for filed, func in fileds.items():
+                data[filed] = func(session)
+            session.add(model(**data))
+        session.commit()
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed else float(count)
+
+
+def bulk_insert(
+        model: Base,
+        fileds: dict[str, Callable],
+        count: int,
+        session: Session,
+        batch_size: int = 1000,
+) -> None:
+    """Вставляет count строк пачками через Core insert (executemany).
+
+    Поддерживаются только поля-колонки: связи вроде Task.products
+    требуют ORM объектов и работают только в обычном режиме."""
+    table = model.__table__
+    unknown = set(fileds) - set(table.c.keys())
+    if unknown:
+        raise ValueError(
+            f'bulk режим не поддерживает поля {sorted(unknown)} '
+            f'модели {model.__name__}'
+        )
+    statement = insert(table)
+    done = 0
+    while done < count:
+        size = min(batch_size, count - done)
+        rows = [
+            {filed: func(session) for filed, func in fileds.items()}
+            for _ in range(size)
+        ]
+        session.execute(statement, rows)
+        session.commit()
+        done += size
+
+
+def _field_values(
+        fileds: dict[str, Callable | Iterator],
+        session: Session,
+) -> Iterator[dict]:
+    """Бесконечный поток словарей полей.
+
+    Значение поля берётся из генератора через next(),
+    а у обычной функции вызовом func(session)."""
+    while True:
+        yield {
+            filed: next(func) if isinstance(func, Iterator) else func(session)
+            for filed, func in fileds.items()
+        }
+
+
+def seed_stream(
+        model: Base,
+        fileds: dict[str, Callable | Iterator],
+        count: int,
+        session: Session,
+        chunk_size: int = 10000,
+        key: str | None = None,
+) -> int:
+    """Потоково генерирует count записей кусками по chunk_size строк.
+
+    Каждый кусок коммитится вместе с отметкой в SeedProgress и
+    выгружается из сессии, поэтому память не растёт с count. После
+    падения повторный вызов с тем же key продолжит с последнего
+    закоммиченного куска.
+
+    :return сколько строк вставлено этим вызовом"""
+    key = key or model.__tablename__
+    committed = session.scalar(
+        select(SeedProgress.committed).where(SeedProgress.key == key)
+    )
+    if committed is None:
+        session.add(SeedProgress(key=key, committed=0))
+        session.commit()
+        committed = 0
+
+    columns_only = set(fileds) <= set(model.__table__.c.keys())
+    statement = insert(model.__table__)
+    rows = _field_values(fileds, session)
+    start = committed
+    while committed < count:
+        size = min(chunk_size, count - committed)
+        chunk = [next(rows) for _ in range(size)]
+        if columns_only:
+            session.execute(statement, chunk)
+        else:
+            session.add_all(model(**data) for data in chunk)
+            session.flush()
+        committed += size
+        session.execute(
+            update(SeedProgress)
+            .where(SeedProgress.key == key)
+            .values(committed=committed)
+        )
+        session.commit()
+        session.expunge_all()
+    return committed - start
 
 
 def add_task(session: Session):
@@ -176,8 +1010,13 @@ def add_task(session: Session):
     session.commit()
 
 
-def init_database(session: Session):
-    data_generator(
+def init_database(
+        session: Session,
+        chunk_size: int = 10000,
+        scale: float = 1,
+):
+    """:argument scale множитель количества записей каждой модели"""
+    seed_stream(
         model=User,
         fileds={
             'name': lambda *_: ''.join(random.choices(
@@ -186,22 +1025,24 @@ def init_database(session: Session):
             )),
             'password': lambda *_: random.randint(100000000, 999999999),
         },
-        count=150,
-        session=session
+        count=round(150 * scale),
+        session=session,
+        chunk_size=chunk_size,
     )
-    data_generator(
+    seed_stream(
         model=Product,
         fileds={
             'name': lambda *_: ''.join(random.choices(
                 string.ascii_lowercase,
                 k=random.randint(7, 24))),
-            'barcode': lambda *_: random.randint(100000000, 999999999),
+            'barcode': barcodes(session),
             'price': lambda *_: random.randint(20, 99999),
         },
-        count=1300,
-        session=session
+        count=round(1300 * scale),
+        session=session,
+        chunk_size=chunk_size,
     )
-    data_generator(
+    seed_stream(
         model=Device,
         fileds={
             'name': lambda *_: 'SKF_' + ''.join(random.choices(
@@ -211,17 +1052,21 @@ def init_database(session: Session):
                 string.ascii_letters + ' ',
                 k=random.randint(24, 170)))
         },
-        count=50,
-        session=session
+        count=round(50 * scale),
+        session=session,
+        chunk_size=chunk_size,
     )
-    data_generator(
+    seed_stream(
         model=Task,
         fileds={
+            'name': lambda *_: ''.join(random.choices(
+                string.ascii_lowercase,
+                k=random.randint(7, 24))),
             'products': product_fabric,
-
         },
-        count=70,
+        count=round(70 * scale),
         session=session,
+        chunk_size=chunk_size,
     )
 
 
@@ -280,7 +1125,8 @@ def init_for_test(session: Session):
 
 
 def main():
-    engine = create_engine(DB_URL, echo=True)
+    engine = get_engine(profile='readonly-analytics')
+    QueryStats(slow_ms=200).attach(engine)
     with (Session(engine) as session):
         # select_count_product_id_avg_price_sum_price(session)
         # init_for_test(session)
@@ -0,0 +1,47 @@
+"""TaskCostFrame считает те же итоги, что и SQL, включая NULL в quantity."""
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+import quest
+from analytics import TaskCostFrame
+from quest import Device, DeviceTask, Product, ProductQuantity, Task
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    quest.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        products = [Product(name='product', barcode=barcode, price=barcode)
+                    for barcode in range(1, 4)]
+        tasks = [Task(name='task') for _ in range(3)]
+        device = Device(name='device', description='')
+        session.add_all([*products, *tasks, device])
+        session.flush()
+        # Первая задача только с NULL, вторая вперемешку, третья без NULL.
+        for task, quantities in zip(tasks, ([None, None], [None, 2], [0, 3])):
+            session.add_all(
+                ProductQuantity(task_id=task.id, product_id=product.id,
+                                quantity=quantity)
+                for product, quantity in zip(products, quantities)
+            )
+        session.add(DeviceTask(device_id=device.id, task_id=tasks[0].id))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def test_by_task_matches_sql(session):
+    frame = TaskCostFrame.load(session)
+    expected = dict(session.execute(quest.task_cost_select()).all())
+    totals = frame.by_task()
+    assert dict(zip(totals.keys.tolist(), totals.total_cost.tolist())) \
+        == expected
+    assert None in expected.values()
+
+
+def test_by_device_all_null(session):
+    totals = TaskCostFrame.load(session).by_device()
+    assert totals.total_cost.tolist() == [None]
+    assert totals.line_items.tolist() == [2]
@@ -0,0 +1,103 @@
+"""QuantityIngestor: групповая запись, обратное давление и отказы."""
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import quest
+from ingest import QuantityIngestor
+from quest import Product, ProductQuantity, Task, TaskCostSummary
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # Файл, а не память: фоновый поток пишет через своё соединение.
+    engine = create_engine(f'sqlite:///{tmp_path / "ingest.sqlite3"}')
+    quest.Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def pairs(engine):
+    with Session(engine) as session:
+        products = [Product(name='product', barcode=barcode, price=barcode)
+                    for barcode in range(1, 6)]
+        tasks = [Task(name='task') for _ in range(2)]
+        session.add_all([*products, *tasks])
+        session.flush()
+        # У первой задачи уже есть строка: итог дополняется, а не пишется.
+        session.add(ProductQuantity(task_id=tasks[0].id,
+                                    product_id=products[0].id, quantity=7))
+        session.commit()
+        return [(task.id, product.id) for task in tasks for product in products]
+
+
+def summary_matches(engine) -> bool:
+    with Session(engine) as session:
+        expected = dict(session.execute(quest.task_cost_select()).all())
+        actual = dict(session.execute(
+            select(TaskCostSummary.task_id, TaskCostSummary.total_cost)
+        ).all())
+    return actual == expected
+
+
+def line_count(engine) -> int:
+    with Session(engine) as session:
+        return session.scalar(select(func.count()).select_from(ProductQuantity))
+
+
+def test_flush_caps_transaction_rows(engine, pairs):
+    with QuantityIngestor(engine, max_batch=3, interval=10) as ingestor:
+        for task_id, product_id in pairs:
+            ingestor.submit(task_id, product_id, 2)
+        ingestor.submit(*pairs[0], 1)
+        ingestor.flush()
+        assert ingestor.rows == len(pairs)
+        assert ingestor.flushes >= -(-len(pairs) // 3)
+    assert line_count(engine) == len(pairs) + 1
+    assert summary_matches(engine)
+
+
+def test_backpressure(engine, pairs):
+    ingestor = QuantityIngestor(engine, interval=10, max_pending=2)
+    ingestor.submit(*pairs[0], 1)
+    ingestor.submit(*pairs[1], 1)
+    with pytest.raises(TimeoutError):
+        ingestor.submit(*pairs[2], 1, timeout=0.05)
+    ingestor.flush()
+    ingestor.submit(*pairs[2], 1, timeout=0.05)
+    ingestor.close()
+    assert ingestor.rows == 3
+
+
+def test_close_writes_pending(engine, pairs):
+    ingestor = QuantityIngestor(engine, interval=10)
+    ingestor.submit(*pairs[0], 5)
+    ingestor.close()
+    assert line_count(engine) == 2
+    assert summary_matches(engine)
+    with pytest.raises(RuntimeError):
+        ingestor.submit(*pairs[0], 1)
+
+
+def test_failed_batch_goes_to_dead_letters(engine, pairs, monkeypatch):
+    ingestor = QuantityIngestor(engine, interval=0.01, max_attempts=2)
+    attempts = []
+
+    def fail(batch):
+        attempts.append(batch)
+        raise OSError('диск недоступен')
+
+    monkeypatch.setattr(ingestor, '_write', fail)
+    ingestor.submit(*pairs[0], 5)
+    with pytest.raises(RuntimeError) as error:
+        ingestor.flush(timeout=5)
+    assert isinstance(error.value.__cause__, OSError)
+    assert len(attempts) == 2
+    assert ingestor.dead_letters == [{pairs[0]: 5}]
+
+    monkeypatch.undo()
+    ingestor.submit(*pairs[1], 1)
+    ingestor.close()
+    assert line_count(engine) == 2
+    assert summary_matches(engine)
@@ -0,0 +1,40 @@
+"""Отчёт по периоду, месяцев в котором больше, чем можно подключить."""
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import quest
+from partitions import MonthPartitions, task_costs_between
+from quest import Product, ProductQuantity, Task
+
+
+def test_window_wider_than_attach_limit(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "main.sqlite3"}')
+    quest.Base.metadata.create_all(engine)
+    months = [datetime(2020, month, 1) for month in range(1, 8)]
+    with Session(engine) as session:
+        product = Product(name='product', barcode=1, price=10)
+        session.add(product)
+        for number, month in enumerate(months, 1):
+            task = Task(name='task', date=month.replace(day=15))
+            task.products.append(
+                ProductQuantity(product=product, quantity=number)
+            )
+            session.add(task)
+        session.commit()
+        expected = {
+            task_id: (10.0, total)
+            for task_id, total in session.execute(quest.task_cost_select())
+        }
+
+    partitions = MonthPartitions(tmp_path / 'months', max_attached=2)
+    # Последний месяц остаётся в основных таблицах.
+    for month in months[:-1]:
+        partitions.partition_month(engine, month)
+
+    with Session(engine) as session:
+        rows = task_costs_between(session, partitions,
+                                  datetime(2020, 1, 1), datetime(2021, 1, 1))
+    assert {task_id: (avg, total) for task_id, avg, total in rows} == expected
+    engine.dispose()
@@ -0,0 +1,122 @@
+"""TaskCostSummary совпадает с task_cost_select() после записей
+в обход flush: bulk_insert, seed_stream и session.execute(update/delete)."""
+import random
+
+import pytest
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import quest
+from quest import Product, ProductQuantity, Task, TaskCostSummary
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    quest.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            Product(name='product', barcode=barcode, price=barcode * 10)
+            for barcode in range(1, 6)
+        )
+        session.add_all(Task(name='task') for _ in range(3))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def assert_summary_matches(session: Session) -> None:
+    expected = dict(session.execute(quest.task_cost_select()).all())
+    actual = dict(session.execute(
+        select(TaskCostSummary.task_id, TaskCostSummary.total_cost)
+    ).all())
+    assert actual == expected
+
+
+def line_fields(session: Session) -> dict:
+    rng = random.Random(0)
+    products = session.scalars(select(Product.id)).all()
+    tasks = session.scalars(select(Task.id)).all()
+    return {
+        'task_id': lambda *_: rng.choice(tasks),
+        'product_id': lambda *_: rng.choice(products),
+        'quantity': lambda *_: rng.randint(1, 9),
+    }
+
+
+def test_bulk_insert(session):
+    quest.data_generator(ProductQuantity, line_fields(session), 50, session,
+                         bulk=True, batch_size=20)
+    assert_summary_matches(session)
+
+
+def test_seed_stream(session):
+    quest.seed_stream(ProductQuantity, line_fields(session), 50, session,
+                      chunk_size=20)
+    assert_summary_matches(session)
+
+
+def test_bulk_update_and_delete(session):
+    quest.seed_stream(ProductQuantity, line_fields(session), 50, session)
+
+    session.execute(update(Product).values(price=Product.price + 1))
+    session.commit()
+    assert_summary_matches(session)
+
+    first_task = session.scalars(select(Task.id)).first()
+    session.execute(
+        update(ProductQuantity)
+        .where(ProductQuantity.quantity > 5)
+        .values(task_id=first_task)
+    )
+    session.commit()
+    assert_summary_matches(session)
+
+    session.execute(delete(ProductQuantity).where(ProductQuantity.quantity < 3))
+    session.commit()
+    assert_summary_matches(session)
+
+
+def test_insert_values(session):
+    task = session.scalars(select(Task.id)).first()
+    product = session.scalars(select(Product.id)).first()
+    session.execute(insert(ProductQuantity).values(
+        task_id=task, product_id=product, quantity=4
+    ))
+    session.commit()
+    assert_summary_matches(session)
+
+
+def test_bulk_update_over_threshold(session, monkeypatch):
+    monkeypatch.setattr(quest, '_REFRESH_ALL_ROWS', 3)
+    quest.seed_stream(ProductQuantity, line_fields(session), 50, session)
+
+    session.execute(update(Product).values(price=Product.price * 2))
+    session.execute(update(ProductQuantity).values(
+        quantity=ProductQuantity.quantity + 1
+    ))
+    session.commit()
+    assert_summary_matches(session)
+
+
+def test_update_without_price_keeps_summary(session, monkeypatch):
+    quest.seed_stream(ProductQuantity, line_fields(session), 20, session)
+    refreshed = []
+    monkeypatch.setattr(quest, 'refresh_task_costs',
+                        lambda *args, **kwargs: refreshed.append(args))
+    session.execute(update(Product).values(name='renamed'))
+    session.commit()
+    assert refreshed == []
+
+
+def test_null_quantities(session):
+    task = session.scalars(select(Task.id)).first()
+    product = session.scalars(select(Product.id)).first()
+    session.add(ProductQuantity(task_id=task, product_id=product,
+                                quantity=None))
+    session.commit()
+    assert session.get(TaskCostSummary, task).total_cost is None
+    assert_summary_matches(session)
+
+    quest.rebuild_task_costs(session)
+    assert_summary_matches(session)